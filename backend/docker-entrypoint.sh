@@ -7,7 +7,18 @@ while ! nc -z "$DB_HOST" 5432; do
 done
 echo "PostgreSQL is up!"
 
-python manage.py migrate --noinput
-python manage.py collectstatic --noinput
+# migrate --check only reads the migration table, the full migrate runs when there are unapplied migrations
+if python manage.py migrate --check --noinput > /dev/null 2>&1; then
+  echo "No migrations to apply"
+else
+  python manage.py migrate --noinput
+fi
 
-gunicorn hornet_finder_api.wsgi:application --bind 0.0.0.0:8000 --access-logfile -
+# The static files are collected when the image is built, without DEBUG. With DEBUG, the Swagger UI and Redoc
+# assets of drf_spectacular_sidecar are installed too and must be collected (only the new files are copied)
+if [ ! -d staticfiles ] || [ "$(echo "${DEBUG:-False}" | tr '[:upper:]' '[:lower:]')" = "true" ]; then
+  python manage.py collectstatic --noinput
+fi
+
+# Workers, threads, preload and recycling are set in gunicorn.conf.py (SERVER_MODE=asgi selects the uvicorn workers)
+exec gunicorn
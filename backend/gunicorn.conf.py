@@ -0,0 +1,97 @@
+"""
+Gunicorn configuration of the API, loaded from the working directory by docker-entrypoint.sh.
+
+The worker and thread counts follow the CPUs available to the container, and every setting can be overridden
+with an environment variable (GUNICORN_*). The application is preloaded in the master process, so the modules
+imported by Django (GeoDjango, GDAL, DRF...) are shared by the workers through copy-on-write instead of being
+loaded once per worker; the workers are recycled after GUNICORN_MAX_REQUESTS requests to bound their memory.
+"""
+import math
+import os
+import resource
+import threading
+import time
+
+_started_at = time.monotonic()
+
+
+def _cpu_count():
+    """CPUs usable by the container: the CPU affinity, capped by the cgroup (v2) CPU quota when there is one."""
+    count = len(os.sched_getaffinity(0))
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+CPU_COUNT = _cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+accesslog = '-'
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'hornet_finder_api.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # An event loop per worker: one worker per CPU
+    workers = int(os.getenv('GUNICORN_WORKERS', CPU_COUNT))
+else:
+    wsgi_app = 'hornet_finder_api.wsgi:application'
+    # Threads overlap the waits on PostgreSQL and Keycloak without paying the memory of more processes
+    worker_class = 'gthread'
+    workers = int(os.getenv('GUNICORN_WORKERS', CPU_COUNT + 1))
+    threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+# Recycle the workers (with jitter, so they do not restart together) to bound the growth of their memory
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+
+def when_ready(server):
+    if preload_app:
+        # Called in the master process before the workers are forked: the connections opened while preloading
+        # (e.g. to fetch the realm keys) must not be inherited and shared by the workers
+        from django.db import connections
+        from hornet_finder_api.utils import reset_keycloak_clients
+
+        connections.close_all()
+        for connection in connections.all(initialized_only=True):
+            # A psycopg pool (DB_POOL) created in the master would be inherited without its worker threads
+            if connection.alias in getattr(connection, '_connection_pools', {}):
+                connection.close_pool()
+        reset_keycloak_clients()
+    server.log.info(
+        f"Ready in {time.monotonic() - _started_at:.2f}s: {workers} {worker_class} worker(s)"
+        + (f" x {threads} thread(s)" if worker_class == 'gthread' else '')
+        + f", {CPU_COUNT} CPU(s), preload={preload_app}"
+    )
+
+
+def post_fork(server, worker):
+    from hornet_finder_api.utils import STATS_LOG_INTERVAL, log_process_stats
+
+    if STATS_LOG_INTERVAL <= 0:
+        return
+
+    def log_periodically():
+        # The caches live in the worker process: each worker logs its own counters
+        while True:
+            time.sleep(STATS_LOG_INTERVAL)
+            log_process_stats()
+
+    threading.Thread(target=log_periodically, name='cache-stats', daemon=True).start()
+
+
+def worker_exit(server, worker):
+    from hornet_finder_api.utils import log_process_stats
+
+    log_process_stats()
+    # Peak memory of the worker, to size GUNICORN_MAX_REQUESTS and the number of workers
+    server.log.info(f"Worker {worker.pid} exiting after {worker.nr} request(s), max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MiB")
@@ -0,0 +1,141 @@
+"""
+Compiled index of the apiary group permissions (ACL), so that an authorization check is a set lookup
+instead of a join through BeekeeperGroup and ApiaryGroupPermission.
+
+The index maps the group paths (the membership paths of the JWT) to the group ids, and each group id to the sets
+of apiary ids its members can read, update and delete. It is built from BeekeeperGroup and ApiaryGroupPermission
+and tagged with the version of AccessControlVersion, a single-row table bumped by database triggers in the same
+transaction as any change of these two tables (ORM, queryset.update, raw SQL). Each request reads the version
+(one primary key lookup), so every worker process applies a permission change as soon as it is committed.
+
+The triggers also log the ids of the changed groups with their version (AccessControlChange). When the version
+changed, the index only reloads the groups changed since its own version; it is built from scratch on first use,
+after a TRUNCATE, or when the log no longer covers all the versions it missed.
+"""
+import threading
+
+from .models import AccessControlChange, AccessControlVersion, ApiaryGroupPermission, BeekeeperGroup
+
+PERM_TYPES = ('read', 'update', 'delete')
+
+
+class ACLSnapshot:
+    """
+    Immutable state of the index for one version, used by one request for all its checks.
+    """
+
+    def __init__(self, version, group_ids, by_group):
+        self.version = version
+        self._group_ids = group_ids  # group path -> group id
+        self._by_group = by_group  # group id -> {perm type -> frozenset of apiary ids}
+
+    def group_ids(self, paths):
+        """
+        Ids of the existing groups among the given paths.
+
+        :param paths: The group paths, e.g. the membership paths of a user
+        :type paths: iterable
+        :rtype: set
+        """
+        return {self._group_ids[path] for path in paths if path in self._group_ids}
+
+    def with_groups(self, version, group_ids, by_group, changed):
+        """
+        A new snapshot where the groups of `changed` are replaced by the given paths and permissions.
+
+        :param version: The version of the new snapshot
+        :param group_ids: Group path -> group id, for the existing groups among the changed ones
+        :param by_group: Group id -> {perm type -> frozenset of apiary ids}, for the changed groups
+        :param changed: The ids of the changed groups (including the deleted ones)
+        :rtype: ACLSnapshot
+        """
+        paths = {path: group_id for path, group_id in self._group_ids.items() if group_id not in changed}
+        paths.update(group_ids)
+        sets = {group_id: perms for group_id, perms in self._by_group.items() if group_id not in changed}
+        sets.update(by_group)
+        return ACLSnapshot(version, paths, sets)
+
+    def allows(self, group_ids, apiary_id, perm_type):
+        """
+        Whether one of the groups has the permission on the apiary.
+
+        :rtype: bool
+        """
+        return any(apiary_id in self._by_group.get(group_id, {}).get(perm_type, ()) for group_id in group_ids)
+
+
+class ApiaryACLIndex:
+    """
+    Thread-safe, per-process index of the apiary permissions of the groups.
+    It is meant to be instantiated once at module level (see apiary_acl).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    @staticmethod
+    def _current_version():
+        # None when the row is missing (e.g. after a flush), the index is then rebuilt on every use
+        return AccessControlVersion.objects.filter(pk=AccessControlVersion.SINGLETON_ID).values_list('version', flat=True).first()
+
+    def current(self):
+        """
+        The snapshot of the current version, updated if the permissions or the groups changed since the last build.
+
+        :rtype: ACLSnapshot
+        """
+        version = self._current_version()
+        snapshot = self._snapshot
+        if snapshot is not None and version is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or version is None or snapshot.version != version:
+                snapshot = self._snapshot = self._update(snapshot, version)
+        return snapshot
+
+    def _update(self, snapshot, version):
+        """Reload the groups changed since the snapshot, or build a new snapshot when the changes are not known."""
+        if snapshot is None or version is None or snapshot.version is None or version < snapshot.version:
+            return self._build(version)
+        changes = list(
+            AccessControlChange.objects.filter(version__gt=snapshot.version, version__lte=version)
+            .values_list('version', 'group_id')
+        )
+        if {change_version for change_version, _ in changes} != set(range(snapshot.version + 1, version + 1)):
+            return self._build(version)  # The log was purged or has no entry for some versions
+        changed = {group_id for _, group_id in changes}
+        if None in changed:
+            return self._build(version)  # TRUNCATE
+        group_ids = dict(BeekeeperGroup.objects.filter(id__in=changed).values_list('path', 'id'))
+        return snapshot.with_groups(version, group_ids, self._load_permissions(group_id__in=changed), changed)
+
+    @staticmethod
+    def _load_permissions(**filters):
+        """Group id -> {perm type -> frozenset of apiary ids} of the ApiaryGroupPermission rows matching the filters."""
+        by_group = {}
+        for apiary_id, group_id, can_read, can_update, can_delete in ApiaryGroupPermission.objects.filter(**filters).values_list(
+            'apiary_id', 'group_id', 'can_read', 'can_update', 'can_delete'
+        ):
+            sets = by_group.setdefault(group_id, {perm_type: set() for perm_type in PERM_TYPES})
+            for perm_type, granted in zip(PERM_TYPES, (can_read, can_update, can_delete)):
+                if granted:
+                    sets[perm_type].add(apiary_id)
+        return {
+            group_id: {perm_type: frozenset(ids) for perm_type, ids in sets.items()}
+            for group_id, sets in by_group.items()
+        }
+
+    @classmethod
+    def _build(cls, version):
+        """Build a snapshot from all the groups and ApiaryGroupPermission rows (two queries)."""
+        group_ids = dict(BeekeeperGroup.objects.values_list('path', 'id'))
+        return ACLSnapshot(version, group_ids, cls._load_permissions())
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+
+apiary_acl = ApiaryACLIndex()
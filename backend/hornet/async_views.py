@@ -0,0 +1,52 @@
+"""
+Async entry points of the public map endpoints (GET /api/hornets/ and GET /api/nests/destroyed/),
+routed instead of the viewsets when the API is served by uvicorn workers (SERVER_MODE=asgi).
+
+Anonymous requests answered by the response cache (see hornet.geocache) are served without going through
+the thread that runs the sync views, so a burst of map pans does not queue behind slower requests.
+Every other request (authenticated, paginated, streamed, invalid, cache miss, POST) is handed to the DRF viewset,
+run in a thread of the default executor of the event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.views.decorators.csrf import csrf_exempt
+
+from .views import HornetViewSet, NestViewSet, get_cached_entry_response, get_public_cached_entry
+
+
+def _run_in_worker_thread(viewset_view):
+    """
+    Run a sync viewset in a thread of the default executor instead of the single thread of the thread-sensitive
+    sync views, so that the requests missing the cache run in parallel (at most the size of the executor).
+    """
+    def run(request, *args, **kwargs):
+        # The request signals of Django only release the connection of the thread of the thread-sensitive views
+        close_old_connections()
+        try:
+            response = viewset_view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()  # Render the JSON here rather than in the thread of the thread-sensitive views
+            return response
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def _cached_list_view(namespace, action, viewset_view):
+    get_entry = sync_to_async(get_public_cached_entry, thread_sensitive=False)
+    run_viewset = _run_in_worker_thread(viewset_view)
+
+    @csrf_exempt  # Same as the DRF views, which authenticate with JWT bearer tokens
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            entry = await get_entry(request, namespace, action)
+            if entry is not None:
+                return get_cached_entry_response(request, entry)
+        return await run_viewset(request, *args, **kwargs)
+
+    return view
+
+
+hornet_list = _cached_list_view('hornets', 'list', HornetViewSet.as_view({'get': 'list', 'post': 'create'}))
+destroyed_nest_list = _cached_list_view('nests', 'destroyed', NestViewSet.as_view({'get': 'destroyed'}))
@@ -0,0 +1,86 @@
+"""
+Grid clustering of the geographic list endpoints, for low zoom map views.
+
+The points are snapped to a Web Mercator grid whose cells have a constant size on screen at the requested zoom,
+and each non-empty cell is returned as a cluster with its count, centroid and a breakdown by category
+(colour marks for hornets, status for nests, infestation level for apiaries).
+"""
+from django.db import connection
+
+from .models import Apiary, Hornet, Nest
+
+# Size of a cluster cell on screen, in pixels of a 256 px tile
+CLUSTER_CELL_PX = 64
+# Width of the Web Mercator world, in meters
+WEB_MERCATOR_WORLD_M = 40075016.686
+MAX_CLUSTER_ZOOM = 22
+
+# Categories of each row of a model, as a SQL array expression over the `item` alias
+BREAKDOWN_SQL = {
+    Hornet: """CASE WHEN item.mark_color_1 = '' AND item.mark_color_2 = '' THEN ARRAY['none']
+                    ELSE ARRAY[NULLIF(item.mark_color_1, ''), NULLIF(NULLIF(item.mark_color_2, ''), item.mark_color_1)] END""",
+    Nest: "ARRAY[CASE WHEN item.destroyed THEN 'destroyed' ELSE 'active' END]",
+    Apiary: "ARRAY[item.infestation_level::text]",
+}
+
+CLUSTER_SQL = """
+WITH items AS (
+    SELECT ST_SnapToGrid(ST_Transform(item.point::geometry, 3857), %s) AS cell,
+           item.point::geometry AS geom,
+           {breakdown} AS categories
+    FROM {table} AS item
+    WHERE item.id IN ({ids})
+),
+clusters AS (
+    SELECT cell, count(*) AS count, ST_Centroid(ST_Collect(geom)) AS center
+    FROM items
+    GROUP BY cell
+),
+categories AS (
+    SELECT cell, category, count(*) AS count
+    FROM items, unnest(categories) AS category
+    WHERE category IS NOT NULL
+    GROUP BY cell, category
+)
+SELECT ST_Y(clusters.center), ST_X(clusters.center), clusters.count,
+       COALESCE((SELECT jsonb_object_agg(category, categories.count) FROM categories WHERE categories.cell = clusters.cell), '{{}}')
+FROM clusters
+ORDER BY clusters.count DESC
+"""
+
+
+def cluster_cell_size_m(zoom):
+    """
+    Size of the grid cells at a zoom level, in Web Mercator meters.
+
+    :param zoom: The zoom level of the map
+    :type zoom: int
+    :rtype: float
+    """
+    return WEB_MERCATOR_WORLD_M / 2 ** zoom * CLUSTER_CELL_PX / 256
+
+
+def cluster_queryset(queryset, zoom):
+    """
+    Aggregate the rows of a (filtered) queryset into grid clusters.
+
+    :param queryset: The filtered hornet, nest or apiary queryset
+    :type queryset: QuerySet
+    :param zoom: The zoom level of the map
+    :type zoom: int
+    :return: The clusters, biggest first, as dicts with latitude, longitude, count and breakdown
+    :rtype: list
+    """
+    ids_sql, ids_params = queryset.order_by().values('id').query.sql_with_params()
+    sql = CLUSTER_SQL.format(
+        breakdown=BREAKDOWN_SQL[queryset.model],
+        table=queryset.model._meta.db_table,
+        ids=ids_sql,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [cluster_cell_size_m(zoom), *ids_params])
+        rows = cursor.fetchall()
+    return [
+        {'latitude': latitude, 'longitude': longitude, 'count': count, 'breakdown': breakdown}
+        for latitude, longitude, count, breakdown in rows
+    ]
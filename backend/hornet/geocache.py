@@ -0,0 +1,195 @@
+"""
+Tile-aligned response cache of the public geographic list endpoints.
+
+The search area of a request is snapped outwards on a fine grid (center snapped to its cell center, radius rounded
+up to a bucket and widened to still cover the requested circle), so that the requests of nearby map pans share
+the same cache entry. The entry key also contains the version of every invalidation tile (a coarser grid) covered
+by the area; saving or deleting a row bumps the version of its tile, which makes the entries covering it unreachable.
+
+The versions live in the Django cache: with the local-memory backend, each worker process has its own cache and
+only sees its own invalidations, so use the file or Redis backend (CACHE_DIR / REDIS_URL) with several workers.
+"""
+import hashlib
+import math
+import os
+import time
+import uuid
+
+from django.core.cache import cache
+
+# Lifetime of the cached responses, in seconds
+GEO_CACHE_TTL = int(os.getenv("GEO_CACHE_TTL", "300"))
+# Grid the search areas are snapped to, in degrees
+GEO_CACHE_SNAP_DEG = 0.01
+# Step the search radius is rounded up to, in km
+GEO_CACHE_RADIUS_STEP_KM = 0.5
+# Grid of the invalidation tiles, in degrees
+GEO_CACHE_TILE_DEG = 0.1
+
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LON_AT_EQUATOR = 111.320
+
+
+def snap_circle(lat, lon, radius):
+    """
+    Snap a search circle: the center moves to the center of its grid cell and the radius is rounded up to a bucket,
+    then widened by half the cell diagonal so that the snapped circle contains the requested one.
+
+    :return: tuple (lat, lon, radius_km) of the snapped circle
+    :rtype: tuple
+    """
+    snapped_lat = round((math.floor(lat / GEO_CACHE_SNAP_DEG) + 0.5) * GEO_CACHE_SNAP_DEG, 6)
+    snapped_lon = round((math.floor(lon / GEO_CACHE_SNAP_DEG) + 0.5) * GEO_CACHE_SNAP_DEG, 6)
+    bucket = math.ceil(radius / GEO_CACHE_RADIUS_STEP_KM) * GEO_CACHE_RADIUS_STEP_KM
+    half_diagonal = math.hypot(GEO_CACHE_SNAP_DEG * KM_PER_DEGREE_LAT, GEO_CACHE_SNAP_DEG * KM_PER_DEGREE_LON_AT_EQUATOR) / 2
+    return snapped_lat, snapped_lon, bucket + half_diagonal
+
+
+def snap_bbox(bbox):
+    """
+    Snap a bounding box outwards on the grid.
+
+    :param bbox: The bounding box as (min_lon, min_lat, max_lon, max_lat)
+    :type bbox: tuple
+    :rtype: tuple
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return (
+        max(round(math.floor(min_lon / GEO_CACHE_SNAP_DEG) * GEO_CACHE_SNAP_DEG, 6), -180),
+        max(round(math.floor(min_lat / GEO_CACHE_SNAP_DEG) * GEO_CACHE_SNAP_DEG, 6), -90),
+        min(round(math.ceil(max_lon / GEO_CACHE_SNAP_DEG) * GEO_CACHE_SNAP_DEG, 6), 180),
+        min(round(math.ceil(max_lat / GEO_CACHE_SNAP_DEG) * GEO_CACHE_SNAP_DEG, 6), 90),
+    )
+
+
+def circle_bbox(lat, lon, radius):
+    """
+    Bounding box of a search circle, used to find the invalidation tiles it covers.
+
+    :rtype: tuple
+    """
+    d_lat = radius / KM_PER_DEGREE_LAT
+    d_lon = radius / (KM_PER_DEGREE_LON_AT_EQUATOR * max(math.cos(math.radians(lat)), 0.01))
+    return lon - d_lon, lat - d_lat, lon + d_lon, lat + d_lat
+
+
+def _tile(lat, lon):
+    return math.floor(lon / GEO_CACHE_TILE_DEG), math.floor(lat / GEO_CACHE_TILE_DEG)
+
+
+def _tile_version_key(namespace, tile):
+    return f"geo:{namespace}:tile:{tile[0]}:{tile[1]}"
+
+
+def _generation_key(namespace):
+    return f"geo:{namespace}:generation"
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def _get_versions(keys):
+    """
+    Current versions of the given keys. A missing version (never set, or evicted by the cache) gets a new random
+    value: an evicted version must not fall back to a value that older entries were stored with.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate_point(namespace, lat, lon):
+    """
+    Invalidate the cached responses covering a point, after a row was saved or deleted there.
+
+    :param namespace: The cached endpoint family ('hornets' or 'nests')
+    :type namespace: str
+    """
+    invalidate_points(namespace, [(lat, lon)])
+
+
+def invalidate_points(namespace, points):
+    """
+    Invalidate the cached responses covering several points, e.g. after a bulk insert (one cache write per tile).
+
+    :param namespace: The cached endpoint family ('hornets' or 'nests')
+    :type namespace: str
+    :param points: The (lat, lon) pairs
+    :type points: iterable
+    """
+    tiles = {_tile(lat, lon) for lat, lon in points if lat is not None and lon is not None}
+    if tiles:
+        cache.set_many({_tile_version_key(namespace, tile): _new_version() for tile in tiles}, None)
+
+
+def invalidate_namespace(namespace):
+    """
+    Invalidate all the cached responses of an endpoint family, after a bulk update.
+
+    :param namespace: The cached endpoint family ('hornets' or 'nests')
+    :type namespace: str
+    """
+    cache.set(_generation_key(namespace), _new_version(), None)
+
+
+def _response_key(namespace, region, bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    min_tile, max_tile = _tile(min_lat, min_lon), _tile(max_lat, max_lon)
+    keys = [_generation_key(namespace)] + [
+        _tile_version_key(namespace, (i, j))
+        for i in range(min_tile[0], max_tile[0] + 1)
+        for j in range(min_tile[1], max_tile[1] + 1)
+    ]
+    versions = _get_versions(keys)
+    digest = hashlib.sha256(repr((region, versions)).encode()).hexdigest()
+    return f"geo:{namespace}:response:{digest}"
+
+
+def get_cached(namespace, region, bbox):
+    """
+    Return the cached response of a snapped region, without rendering it when it is missing or invalidated.
+
+    :param namespace: The cached endpoint family ('hornets' or 'nests')
+    :type namespace: str
+    :param region: The snapped region and the other parameters the body depends on, part of the cache key
+    :type region: tuple
+    :param bbox: The bounding box of the region, as (min_lon, min_lat, max_lon, max_lat)
+    :type bbox: tuple
+    :return: dict with body, etag and last_modified (timestamp), or None on a miss
+    :rtype: dict
+    """
+    return cache.get(_response_key(namespace, region, bbox))
+
+
+def get_or_render(namespace, region, bbox, render):
+    """
+    Return the cached response body of a snapped region, rendering and storing it when missing or invalidated.
+
+    :param namespace: The cached endpoint family ('hornets' or 'nests')
+    :type namespace: str
+    :param region: The snapped region and the other parameters the body depends on, part of the cache key
+    :type region: tuple
+    :param bbox: The bounding box of the region, as (min_lon, min_lat, max_lon, max_lat)
+    :type bbox: tuple
+    :param render: Callable returning the body (bytes), or None when the response must not be cached
+    :type render: callable
+    :return: dict with body, etag and last_modified (timestamp), or None when render returned None
+    :rtype: dict
+    """
+    key = _response_key(namespace, region, bbox)
+    entry = cache.get(key)
+    if entry is None:
+        body = render()
+        if body is None:
+            return None
+        entry = {
+            'body': body,
+            'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            'last_modified': int(time.time()),
+        }
+        cache.set(key, entry, GEO_CACHE_TTL)
+    return entry
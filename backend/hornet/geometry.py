@@ -0,0 +1,90 @@
+"""
+Return zone ("cone") parameters and geometry of the hornet observations.
+The parameters mirror the constants of the frontend (frontend/src/utils/constants.ts), keep them in sync.
+"""
+import math
+import os
+
+from django.contrib.gis.geos import Polygon
+
+# Opening angle of the return cone, in degrees
+RETURN_ZONE_ANGLE_DEG = 6
+# Length of the return cone when no absence duration was observed, in meters
+RETURN_ZONE_DEFAULT_DISTANCE_M = 2000
+# Upper bound of the return cone length, even with a very long absence duration, in meters
+RETURN_ZONE_ABSOLUTE_MAX_DISTANCE_M = 3000
+# Estimated flight speed of a hornet returning to its nest, in meters per minute
+HORNET_FLIGHT_SPEED_M_PER_MIN = 100
+
+# Magnetic declination added to the compass direction, in degrees (east positive).
+# The frontend computes it with the World Magnetic Model; the backend uses a regional value (about +2° in Belgium).
+MAGNETIC_DECLINATION_DEG = float(os.getenv("MAGNETIC_DECLINATION_DEG", "2.0"))
+
+EARTH_RADIUS_M = 6371000
+
+
+def return_zone_length_m(duration):
+    """
+    Compute the length of the return cone from the absence duration of the hornet.
+
+    :param duration: The absence duration in seconds, or None
+    :type duration: int
+    :return: The length of the cone in meters
+    :rtype: float
+    """
+    if not duration or duration <= 0:
+        return RETURN_ZONE_DEFAULT_DISTANCE_M
+    return min(round(duration / 60 * HORNET_FLIGHT_SPEED_M_PER_MIN), RETURN_ZONE_ABSOLUTE_MAX_DISTANCE_M)
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between two points, in meters.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def destination_point(lat, lon, bearing_deg, distance_m):
+    """
+    Point reached from (lat, lon) after distance_m meters along the given bearing, on a spherical earth.
+
+    :return: tuple (lat, lon) in degrees
+    :rtype: tuple
+    """
+    phi1, lambda1 = math.radians(lat), math.radians(lon)
+    theta = math.radians(bearing_deg)
+    delta = distance_m / EARTH_RADIUS_M
+    phi2 = math.asin(math.sin(phi1) * math.cos(delta) + math.cos(phi1) * math.sin(delta) * math.cos(theta))
+    lambda2 = lambda1 + math.atan2(
+        math.sin(theta) * math.sin(delta) * math.cos(phi1),
+        math.cos(delta) - math.sin(phi1) * math.sin(phi2),
+    )
+    return math.degrees(phi2), math.degrees(lambda2)
+
+
+def return_cone_polygon(lat, lon, direction, duration):
+    """
+    Build the return cone of a hornet observation, as drawn by the frontend (HornetReturnZone):
+    a triangle-like polygon starting at the hornet, oriented by the declination corrected direction.
+
+    :param lat: The latitude of the hornet
+    :param lon: The longitude of the hornet
+    :param direction: The compass direction of the flight, in degrees
+    :param duration: The absence duration in seconds, or None
+    :return: The cone polygon (SRID 4326)
+    :rtype: Polygon
+    """
+    bearing = direction + MAGNETIC_DECLINATION_DEG
+    length = return_zone_length_m(duration)
+    half_angle = RETURN_ZONE_ANGLE_DEG / 2
+    vertices = [
+        destination_point(lat, lon, bearing - half_angle, length),
+        destination_point(lat, lon, bearing, length),
+        destination_point(lat, lon, bearing + half_angle, length),
+    ]
+    ring = [(lon, lat)] + [(vertex_lon, vertex_lat) for vertex_lat, vertex_lon in vertices] + [(lon, lat)]
+    return Polygon(ring, srid=4326)
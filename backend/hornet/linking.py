@@ -0,0 +1,84 @@
+"""
+Batch linking of the hornets to the nest they most likely come from.
+
+An unlinked hornet is linked to the nearest live (not destroyed) nest lying inside its return cone.
+All the hornets of a run are matched and updated by a single set-based UPDATE: for each hornet, a LATERAL
+subquery finds the nearest nest with ST_DWithin (answered by the GiST index on the nest points) and checks
+that it lies inside the stored return cone.
+
+A run only scans the hornets created or updated (updated_at) since the previous run, including those whose return
+cone was computed later. Like the incremental sync (see hornet.sync), the cursor of the next run is taken before
+the scan and moved back by SYNC_OVERLAP_SECONDS, so a hornet committed during a run is scanned by the next one
+even if its id is lower than the ids already scanned.
+"""
+import time
+
+from django.db import connection, transaction
+
+from .geocache import invalidate_namespace
+from .geometry import RETURN_ZONE_ABSOLUTE_MAX_DISTANCE_M
+from .models import Hornet, Nest, NestLinkingRun
+from .sync import next_cursor
+
+LINK_SQL = """
+UPDATE {hornet_table} AS hornet
+SET linked_nest_id = match.nest_id, updated_at = now()
+FROM (
+    SELECT candidate.id AS hornet_id, nearest.id AS nest_id
+    FROM {hornet_table} AS candidate
+    CROSS JOIN LATERAL (
+        SELECT nest.id
+        FROM {nest_table} AS nest
+        WHERE NOT nest.destroyed
+          AND ST_DWithin(nest.point, candidate.point, %(max_distance)s)
+          AND ST_Intersects(nest.point::geometry, candidate.return_zone)
+        ORDER BY nest.point <-> candidate.point
+        LIMIT 1
+    ) AS nearest
+    WHERE candidate.linked_nest_id IS NULL
+      AND candidate.return_zone IS NOT NULL
+      AND (%(since)s::timestamptz IS NULL OR candidate.updated_at >= %(since)s)
+) AS match
+WHERE hornet.id = match.hornet_id
+"""
+
+SCANNED_SQL = """
+SELECT count(*) FROM {hornet_table}
+WHERE linked_nest_id IS NULL AND (%(since)s::timestamptz IS NULL OR updated_at >= %(since)s)
+"""
+
+
+def link_hornets_to_nests(full=False):
+    """
+    Link the unlinked hornets to the nearest live nest inside their return cone.
+
+    :param full: Scan all the unlinked hornets, instead of only the hornets created or updated since the last run
+    :type full: bool
+    :return: The bookkeeping record of the run (scanned and linked hornets, duration)
+    :rtype: NestLinkingRun
+    """
+    start = time.perf_counter()
+    last_run = None if full else NestLinkingRun.objects.filter(next_since__isnull=False).order_by('-started_at').first()
+    next_since = next_cursor()
+    params = {
+        'max_distance': RETURN_ZONE_ABSOLUTE_MAX_DISTANCE_M,
+        'since': last_run.next_since if last_run else None,
+    }
+    tables = {'hornet_table': Hornet._meta.db_table, 'nest_table': Nest._meta.db_table}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(SCANNED_SQL.format(**tables), params)
+        scanned = cursor.fetchone()[0]
+        cursor.execute(LINK_SQL.format(**tables), params)
+        linked = cursor.rowcount
+
+    if linked:
+        invalidate_namespace('hornets')
+
+    return NestLinkingRun.objects.create(
+        duration=time.perf_counter() - start,
+        full=full,
+        next_since=next_since,
+        hornets_scanned=scanned,
+        hornets_linked=linked,
+    )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from hornet.geometry import return_cone_polygon
+from hornet.models import Hornet
+
+
+class Command(BaseCommand):
+    help = "Compute the precomputed return cone (Hornet.return_zone) of the hornets, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of hornets updated per batch (default: 1000).")
+        parser.add_argument('--all', action='store_true',
+                            help="Recompute every cone, e.g. after changing MAGNETIC_DECLINATION_DEG (default: only missing cones).")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+
+        queryset = Hornet.objects.all() if options['all'] else Hornet.objects.filter(return_zone__isnull=True)
+        queryset = queryset.only(*Hornet.RETURN_ZONE_FIELDS).order_by('id')
+
+        updated = 0
+        last_id = 0
+        while True:
+            hornets = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not hornets:
+                break
+            now = timezone.now()
+            for hornet in hornets:
+                hornet.return_zone = return_cone_polygon(hornet.latitude, hornet.longitude, hornet.direction, hornet.duration)
+                hornet.updated_at = now  # So that the next linking run scans them
+            Hornet.objects.bulk_update(hornets, ['return_zone', 'updated_at'])
+            updated += len(hornets)
+            last_id = hornets[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f"{updated} return zone(s) computed."))
@@ -0,0 +1,47 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the latency of GET /api/hornets/ when each request opens a new database connection "
+        "and when the connections are reused (persistent connections, or the pool when DB_POOL is set)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per mode (default: 200).")
+        parser.add_argument('--max-age', type=int, default=60, help="CONN_MAX_AGE of the persistent mode (default: 60).")
+        parser.add_argument('--lat', type=float, default=50.85, help="Latitude of the search center (default: Brussels).")
+        parser.add_argument('--lon', type=float, default=4.35, help="Longitude of the search center (default: Brussels).")
+        parser.add_argument('--radius', type=float, default=5, help="Search radius in km (default: 5).")
+
+    def handle(self, *args, **options):
+        if connection.settings_dict['OPTIONS'].get('pool'):
+            modes = [('pool', 0)]
+        else:
+            modes = [('new connection', 0), ('persistent', options['max_age'])]
+        client = Client(HTTP_HOST='localhost')
+        # page_size bypasses the response cache, so that every request queries the database
+        params = {'lat': options['lat'], 'lon': options['lon'], 'radius': options['radius'], 'page_size': 50}
+
+        self.stdout.write(f"{'mode':>16} {'median (ms)':>12} {'p95 (ms)':>10}")
+        for name, max_age in modes:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            durations = []
+            for _ in range(options['requests']):
+                start = time.perf_counter()
+                response = client.get('/api/hornets/', params)
+                # The test client does not release the connection, the request handler does it on request_finished
+                close_old_connections()
+                durations.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    self.stderr.write(f"GET /api/hornets/ returned {response.status_code}")
+                    return
+            p95 = statistics.quantiles(durations, n=20)[-1]
+            self.stdout.write(f"{name:>16} {statistics.median(durations):>12.2f} {p95:>10.2f}")
+        connection.close()
@@ -0,0 +1,77 @@
+import random
+import statistics
+import time
+
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from hornet.models import Hornet
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the radius filter of the geographic list endpoints (annotate-then-filter vs ST_DWithin) "
+        "on synthetic hornets. The hornets are inserted in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help="Comma-separated numbers of synthetic hornets (default: 10000,100000,1000000).")
+        parser.add_argument('--radius', type=float, default=5, help="Search radius in km (default: 5).")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per query, the median is reported (default: 5).")
+        parser.add_argument('--lat', type=float, default=50.85, help="Latitude of the search center (default: Brussels).")
+        parser.add_argument('--lon', type=float, default=4.35, help="Longitude of the search center (default: Brussels).")
+        parser.add_argument('--spread', type=float, default=1.0,
+                            help="Half-size in degrees of the square where the hornets are spread (default: 1.0).")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be a comma-separated list of integers.")
+
+        center = Point(options['lon'], options['lat'], srid=4326)
+        radius = D(km=options['radius'])
+        queries = {
+            'annotate+filter': lambda: Hornet.objects.annotate(distance=Distance('point', center)).filter(distance__lte=radius),
+            'dwithin': lambda: Hornet.objects.filter(point__dwithin=(center, radius)),
+        }
+
+        self.stdout.write(f"{'hornets':>10} {'matches':>8} " + ' '.join(f"{name + ' (ms)':>22}" for name in queries))
+        for size in sizes:
+            with transaction.atomic():
+                self._insert_hornets(size, options['lat'], options['lon'], options['spread'])
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {Hornet._meta.db_table}")
+
+                timings = {}
+                matches = 0
+                for name, build_queryset in queries.items():
+                    durations = []
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        matches = len(build_queryset().values_list('id', flat=True))
+                        durations.append((time.perf_counter() - start) * 1000)
+                    timings[name] = statistics.median(durations)
+
+                self.stdout.write(f"{size:>10} {matches:>8} " + ' '.join(f"{timings[name]:>22.1f}" for name in queries))
+                transaction.set_rollback(True)
+
+    def _insert_hornets(self, size, lat, lon, spread, batch_size=10000):
+        rng = random.Random(size)
+        for start in range(0, size, batch_size):
+            hornets = []
+            for _ in range(min(batch_size, size - start)):
+                hornet_lat = lat + rng.uniform(-spread, spread)
+                hornet_lon = lon + rng.uniform(-spread, spread)
+                # bulk_create bypasses GeolocatedModel.save(), so the point is set here
+                hornets.append(Hornet(
+                    latitude=hornet_lat,
+                    longitude=hornet_lon,
+                    point=Point(hornet_lon, hornet_lat, srid=4326),
+                    direction=rng.randrange(360),
+                ))
+            Hornet.objects.bulk_create(hornets)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from hornet.linking import link_hornets_to_nests
+
+
+class Command(BaseCommand):
+    help = "Link the unlinked hornets to the nearest live nest inside their return cone (only the hornets created or updated since the last run by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Scan all the unlinked hornets, e.g. after new nests were reported.")
+
+    def handle(self, *args, **options):
+        run = link_hornets_to_nests(full=options['full'])
+        throughput = run.hornets_scanned / run.duration if run.duration else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{run.hornets_linked} of {run.hornets_scanned} hornet(s) linked in {run.duration:.2f} s "
+            f"({throughput:.0f} hornets/s)."
+        ))
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from hornet.models import Tombstone
+from hornet.sync import TOMBSTONE_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    help = "Delete the tombstones of the incremental sync older than the retention period (TOMBSTONE_RETENTION_DAYS)."
+
+    def handle(self, *args, **options):
+        limit = timezone.now() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=limit).delete()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} tombstone(s) older than {TOMBSTONE_RETENTION_DAYS} days deleted."))
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from hornet.models import User
+from hornet_finder_api.utils import get_realm_profiles
+
+
+class Command(BaseCommand):
+    help = "Refresh the local user profiles (username and display name) from one listing of the Keycloak realm, updated in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Number of users updated per batch (default: 200).")
+        parser.add_argument('--stale-after', type=float, default=24,
+                            help="Only refresh the profiles synced more than this many hours ago (default: 24). Use 0 to refresh all of them.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+
+        threshold = timezone.now() - timedelta(hours=options['stale_after'])
+        guids = list(
+            User.objects.filter(Q(profile_synced_at__isnull=True) | Q(profile_synced_at__lt=threshold))
+            .order_by('guid')
+            .values_list('guid', flat=True)
+        )
+        self.stdout.write(f"{len(guids)} user profile(s) to refresh.")
+
+        if not guids:
+            self.stdout.write(self.style.SUCCESS("0 user profile(s) refreshed, 0 user(s) not found in Keycloak."))
+            return
+        # The realm is listed once per run, then matched with the local users
+        try:
+            profiles = get_realm_profiles()
+        except Exception as e:
+            raise CommandError(f"Failed to retrieve the profiles from Keycloak: {type(e).__name__}: {e}")
+
+        updated = not_found = 0
+        for start in range(0, len(guids), batch_size):
+            now = timezone.now()
+            users = []
+            for guid in guids[start:start + batch_size]:
+                profile = profiles.get(str(guid))
+                if profile is None:
+                    not_found += 1
+                    continue
+                users.append(User(guid=guid, profile_synced_at=now, **profile))
+            User.objects.bulk_update(users, ['username', 'display_name', 'profile_synced_at'])
+            updated += len(users)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{updated} user profile(s) refreshed, {not_found} user(s) not found in Keycloak."
+        ))
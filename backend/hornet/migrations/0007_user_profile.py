@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0006_beekeepergroup_apiarygrouppermission_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='username',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='display_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='profile_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-17 11:00
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0007_user_profile'),
+    ]
+
+    # The implicit spatial index created by Django on each point column is replaced by an explicit, named GiST index
+    operations = [
+        migrations.AlterField(
+            model_name='apiary',
+            name='point',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, spatial_index=False, srid=4326),
+        ),
+        migrations.AlterField(
+            model_name='hornet',
+            name='point',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, spatial_index=False, srid=4326),
+        ),
+        migrations.AlterField(
+            model_name='nest',
+            name='point',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, spatial_index=False, srid=4326),
+        ),
+        migrations.AddIndex(
+            model_name='apiary',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['point'], name='hornet_apiary_point_gist'),
+        ),
+        migrations.AddIndex(
+            model_name='hornet',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['point'], name='hornet_hornet_point_gist'),
+        ),
+        migrations.AddIndex(
+            model_name='nest',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['point'], name='hornet_nest_point_gist'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0008_point_gist_index'),
+    ]
+
+    # The existing hornets are filled by the backfill_return_zones management command
+    operations = [
+        migrations.AddField(
+            model_name='hornet',
+            name='return_zone',
+            field=django.contrib.gis.db.models.fields.PolygonField(blank=True, null=True, srid=4326),
+        ),
+    ]
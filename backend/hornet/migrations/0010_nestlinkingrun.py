@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0009_hornet_return_zone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NestLinkingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('duration', models.FloatField(default=0)),
+                ('full', models.BooleanField(default=False)),
+                ('last_hornet_id', models.IntegerField(default=0)),
+                ('hornets_scanned', models.IntegerField(default=0)),
+                ('hornets_linked', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:00
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0010_nestlinkingrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apiary',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='hornet',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='nest',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # The existing rows were last updated at an unknown time, their creation time is the best estimate
+        migrations.RunSQL(
+            sql=[
+                "UPDATE hornet_apiary SET updated_at = created_at",
+                "UPDATE hornet_hornet SET updated_at = created_at",
+                "UPDATE hornet_nest SET updated_at = created_at",
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.IntegerField()),
+                ('point', django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, spatial_index=False, srid=4326)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['model', 'deleted_at'], name='hornet_tombstone_model_deleted'),
+                    django.contrib.postgres.indexes.GistIndex(fields=['point'], name='hornet_tombstone_point_gist'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+ACL_TABLES = ('hornet_beekeepergroup', 'hornet_apiarygrouppermission')
+
+CREATE_TRIGGERS = [
+    "INSERT INTO hornet_accesscontrolversion (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING",
+    """
+    CREATE FUNCTION hornet_bump_access_control_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE hornet_accesscontrolversion SET version = version + 1 WHERE id = 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+] + [
+    f"""
+    CREATE TRIGGER {table}_bump_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+    FOR EACH STATEMENT EXECUTE FUNCTION hornet_bump_access_control_version()
+    """
+    for table in ACL_TABLES
+]
+
+DROP_TRIGGERS = [f"DROP TRIGGER IF EXISTS {table}_bump_acl_version ON {table}" for table in ACL_TABLES] + [
+    "DROP FUNCTION IF EXISTS hornet_bump_access_control_version()",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0011_updated_at_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessControlVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
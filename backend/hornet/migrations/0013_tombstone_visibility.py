@@ -0,0 +1,32 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0012_accesscontrolversion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tombstone',
+            name='object_id',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='created_by',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='read_group_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='destroyed',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0013_tombstone_visibility'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nestlinkingrun',
+            name='next_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='nestlinkingrun',
+            name='last_hornet_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
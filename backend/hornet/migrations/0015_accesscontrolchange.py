@@ -0,0 +1,102 @@
+from django.db import migrations, models
+
+ACL_TABLES = ('hornet_beekeepergroup', 'hornet_apiarygrouppermission')
+# Number of versions kept in hornet_accesscontrolchange: a process further behind reloads the whole index
+ACL_CHANGE_LOG_SIZE = 1000
+
+CREATE_TRIGGERS = [f"DROP TRIGGER IF EXISTS {table}_bump_acl_version ON {table}" for table in ACL_TABLES] + [
+    "DROP FUNCTION IF EXISTS hornet_bump_access_control_version()",
+    f"""
+    CREATE FUNCTION hornet_log_access_control_change() RETURNS trigger AS $$
+    DECLARE
+        new_version bigint;
+        group_ids bigint[];
+    BEGIN
+        IF TG_LEVEL = 'STATEMENT' THEN
+            group_ids := ARRAY[NULL]::bigint[];  -- TRUNCATE: every group may have changed
+        ELSIF TG_TABLE_NAME = 'hornet_beekeepergroup' THEN
+            IF TG_OP = 'INSERT' THEN
+                group_ids := ARRAY[NEW.id];
+            ELSIF TG_OP = 'DELETE' THEN
+                group_ids := ARRAY[OLD.id];
+            ELSE
+                group_ids := ARRAY[OLD.id, NEW.id];
+            END IF;
+        ELSIF TG_OP = 'INSERT' THEN
+            group_ids := ARRAY[NEW.group_id];
+        ELSIF TG_OP = 'DELETE' THEN
+            group_ids := ARRAY[OLD.group_id];
+        ELSE
+            group_ids := ARRAY[OLD.group_id, NEW.group_id];
+        END IF;
+
+        UPDATE hornet_accesscontrolversion SET version = version + 1 WHERE id = 1 RETURNING version INTO new_version;
+        IF new_version IS NOT NULL THEN
+            INSERT INTO hornet_accesscontrolchange (version, group_id) SELECT DISTINCT new_version, unnest(group_ids);
+            DELETE FROM hornet_accesscontrolchange WHERE version <= new_version - {ACL_CHANGE_LOG_SIZE};
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+] + [
+    sql
+    for table in ACL_TABLES
+    for sql in (
+        f"""
+        CREATE TRIGGER {table}_log_acl_change
+        AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION hornet_log_access_control_change()
+        """,
+        f"""
+        CREATE TRIGGER {table}_log_acl_truncate
+        AFTER TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION hornet_log_access_control_change()
+        """,
+    )
+]
+
+DROP_TRIGGERS = [
+    sql
+    for table in ACL_TABLES
+    for sql in (
+        f"DROP TRIGGER IF EXISTS {table}_log_acl_change ON {table}",
+        f"DROP TRIGGER IF EXISTS {table}_log_acl_truncate ON {table}",
+    )
+] + [
+    "DROP FUNCTION IF EXISTS hornet_log_access_control_change()",
+    """
+    CREATE FUNCTION hornet_bump_access_control_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE hornet_accesscontrolversion SET version = version + 1 WHERE id = 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+] + [
+    f"""
+    CREATE TRIGGER {table}_bump_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+    FOR EACH STATEMENT EXECUTE FUNCTION hornet_bump_access_control_version()
+    """
+    for table in ACL_TABLES
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0014_nestlinkingrun_next_since'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessControlChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(db_index=True)),
+                ('group_id', models.BigIntegerField(null=True)),
+            ],
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
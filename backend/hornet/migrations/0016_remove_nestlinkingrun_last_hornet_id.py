@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hornet', '0015_accesscontrolchange'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='nestlinkingrun',
+            name='last_hornet_id',
+        ),
+    ]
@@ -1,11 +1,18 @@
 from django.db import models
 from django.contrib.gis.db import models as geomodels
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GistIndex
+from .geometry import return_cone_polygon
 from django.contrib.gis.geos import Point
 
 
 class User(models.Model):
     guid = models.UUIDField(primary_key=True, editable=False)
     date_created = models.DateTimeField(auto_now_add=True)
+    # Profile denormalized from Keycloak (JWT claims or sync_user_profiles command), so reads never call Keycloak
+    username = models.CharField(max_length=255, blank=True, default='')
+    display_name = models.CharField(max_length=255, blank=True, default='')
+    profile_synced_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return str(self.guid)
@@ -14,15 +21,33 @@ class User(models.Model):
 class GeolocatedModel(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
-    point = geomodels.PointField(geography=True, srid=4326, null=True, blank=True)
+    point = geomodels.PointField(geography=True, srid=4326, null=True, blank=True, spatial_index=False)
 
     class Meta:
         abstract = True  # No table will be created for this model
+        # Explicit GiST index on point, used by the dwithin and bbox filters of the geographic list endpoints
+        indexes = [GistIndex(fields=['point'], name='%(app_label)s_%(class)s_point_gist')]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded location, to invalidate the cached responses of both places when a row moves
+        instance._loaded_location = (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+        return instance
 
     def save(self, *args, **kwargs):
+        self.update_geometries()
+        super().save(*args, **kwargs)
+
+    def update_geometries(self):
+        """Compute point and the derived geometries from the fields (called by save, call it before bulk_create)."""
         if self.latitude is not None and self.longitude is not None:
             self.point = Point(self.longitude, self.latitude, srid=4326)
-        super().save(*args, **kwargs)
+        self.update_derived_geometries()
+
+    def update_derived_geometries(self):
+        """Hook for the subclasses storing geometries computed from their fields (called by save)."""
+        pass
 
 class Hornet(GeolocatedModel):
     COLOR_CHOICES = [
@@ -49,8 +74,34 @@ class Hornet(GeolocatedModel):
     mark_color_1 = models.CharField(max_length=20, choices=COLOR_CHOICES, blank=True, default='')
     mark_color_2 = models.CharField(max_length=20, choices=COLOR_CHOICES, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Used by the incremental sync (since parameter)
     created_by = models.ForeignKey('User', null=True, blank=True, on_delete=models.SET_NULL)
     linked_nest = models.ForeignKey('Nest', null=True, blank=True, on_delete=models.SET_NULL)
+    # Precomputed return cone (see hornet.geometry), spatially indexed for the cone intersection queries
+    return_zone = geomodels.PolygonField(srid=4326, null=True, blank=True)
+
+    # Fields the return cone is computed from
+    RETURN_ZONE_FIELDS = ('latitude', 'longitude', 'direction', 'duration')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded inputs of the return cone, to recompute it only when they change
+        instance._loaded_return_zone_inputs = instance._return_zone_inputs()
+        return instance
+
+    def _return_zone_inputs(self):
+        return tuple(self.__dict__.get(field) for field in self.RETURN_ZONE_FIELDS)
+
+    def update_derived_geometries(self):
+        inputs = self._return_zone_inputs()
+        if self.return_zone is not None and inputs == getattr(self, '_loaded_return_zone_inputs', None):
+            return
+        if self.latitude is None or self.longitude is None or self.direction is None:
+            self.return_zone = None
+        else:
+            self.return_zone = return_cone_polygon(self.latitude, self.longitude, self.direction, self.duration)
+        self._loaded_return_zone_inputs = inputs
 
 class Nest(GeolocatedModel):
     id = models.AutoField(primary_key=True)
@@ -59,6 +110,7 @@ class Nest(GeolocatedModel):
     destroyed = models.BooleanField(default=False)
     destroyed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Used by the incremental sync (since parameter)
     created_by = models.ForeignKey('User', null=True, blank=True, on_delete=models.SET_NULL)
     comments = models.TextField(null=True, blank=True)
 
@@ -91,6 +143,26 @@ class ApiaryGroupPermission(models.Model):
             perms.append('delete')
         return f"{self.group.name} on {self.apiary.id}: {', '.join(perms)}"
 
+class AccessControlVersion(models.Model):
+    """
+    Single row whose version is incremented by database triggers whenever BeekeeperGroup or ApiaryGroupPermission
+    change, in the same transaction. The ACL index of each worker process updates itself when it changes (see hornet.acl).
+    """
+    SINGLETON_ID = 1
+
+    version = models.BigIntegerField(default=0)
+
+
+class AccessControlChange(models.Model):
+    """
+    Group whose BeekeeperGroup row or ApiaryGroupPermission rows changed at an ACL version, written by the same
+    database triggers. The ACL index of each worker process only reloads these groups (see hornet.acl).
+    Only the last 1000 versions are kept (see migration 0015).
+    """
+    version = models.BigIntegerField(db_index=True)
+    group_id = models.BigIntegerField(null=True)  # None when every group may have changed (TRUNCATE)
+
+
 class Apiary(GeolocatedModel):
     INFESTATION_LEVEL_CHOICES = [
         (1, "Light"),
@@ -101,6 +173,7 @@ class Apiary(GeolocatedModel):
     id = models.AutoField(primary_key=True)
     infestation_level = models.IntegerField(choices=INFESTATION_LEVEL_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Used by the incremental sync (since parameter)
     created_by = models.ForeignKey('User', null=True, blank=True, on_delete=models.SET_NULL)
     comments = models.TextField(null=True, blank=True)
     # groups that can access this apiary, with permissions
@@ -110,3 +183,38 @@ class Apiary(GeolocatedModel):
         blank=True,
         related_name="apiaries"
     )
+
+
+class NestLinkingRun(models.Model):
+    """Bookkeeping of the batch linking of hornets to nests (see hornet.linking), used to process only the new or updated hornets."""
+    started_at = models.DateTimeField(auto_now_add=True)
+    duration = models.FloatField(default=0)  # seconds
+    full = models.BooleanField(default=False)  # All the unlinked hornets were scanned, not only the new ones
+    next_since = models.DateTimeField(null=True, blank=True)  # The next run scans the hornets updated since then
+    hornets_scanned = models.IntegerField(default=0)
+    hornets_linked = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.started_at:%Y-%m-%d %H:%M}: {self.hornets_linked}/{self.hornets_scanned} hornets linked"
+
+
+class Tombstone(models.Model):
+    """Log of the deleted hornets, nests and apiaries, returned by the incremental sync of the list endpoints."""
+    model = models.CharField(max_length=32)  # Model name of the deleted row (hornet, nest or apiary)
+    object_id = models.BigIntegerField()
+    point = geomodels.PointField(geography=True, srid=4326, null=True, blank=True, spatial_index=False)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    # Visibility of the deleted row, so the sync only reports it to the users who could see it in the list:
+    # its creator, the groups allowed to read it (apiaries) and its destroyed state (nests)
+    created_by = models.UUIDField(null=True, blank=True)
+    read_group_ids = ArrayField(models.BigIntegerField(), default=list, blank=True)
+    destroyed = models.BooleanField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='hornet_tombstone_model_deleted'),
+            GistIndex(fields=['point'], name='hornet_tombstone_point_gist'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted at {self.deleted_at:%Y-%m-%d %H:%M}"
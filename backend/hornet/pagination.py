@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class GeographicCursorPagination(CursorPagination):
+    """
+    Opt-in keyset (cursor) pagination for the geographic list endpoints.
+    Lists are only paginated when the `cursor` or `page_size` query parameter is given,
+    so clients expecting a plain JSON array keep working.
+    Pages are ordered by descending id, which follows the creation order.
+    """
+    ordering = '-id'
+    page_size = 500
+    page_size_query_param = 'page_size'
+    max_page_size = 5000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,133 @@
+"""
+Apiary access rules shared by the views (see doc/APIARY_PERMISSIONS.md).
+"""
+from django.db.models import Exists, OuterRef, Prefetch, Q
+
+from .acl import apiary_acl
+from .models import ApiaryGroupPermission
+
+# Apiary permission checked by each action of ApiaryViewSet
+ACTION_PERMISSIONS = {
+    'retrieve': 'read',
+    'update': 'update',
+    'partial_update': 'update',
+    'destroy': 'delete',
+}
+
+
+def get_membership_paths(user):
+    """Extracts the list of group paths from the JWT token (scope 'membership')."""
+    token_info = getattr(user, 'token_info', None)
+    if not token_info:
+        return []
+    return token_info.get('membership', [])
+
+
+class ApiaryPermissionResolver:
+    """
+    Permissions of the user of one request on the apiaries. The ACL snapshot is taken and the membership paths
+    of the JWT are resolved to group ids once, on the first check that needs them.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.guid = str(getattr(user, 'guid', None))
+        self.is_admin = 'admin' in getattr(user, 'roles', [])
+        self._acl = None
+        self._group_ids = None
+
+    @property
+    def acl(self):
+        if self._acl is None:
+            self._acl = apiary_acl.current()
+        return self._acl
+
+    @property
+    def group_ids(self):
+        if self._group_ids is None:
+            self._group_ids = self.acl.group_ids(get_membership_paths(self.user))
+        return self._group_ids
+
+    def has_permission(self, apiary, perm_type):
+        """
+        Checks if the user has the required permission (read/update/delete) on the apiary: admins and owners always do,
+        other users through the permissions of their groups, looked up in the compiled ACL index (see hornet.acl).
+
+        :param apiary: The apiary
+        :type apiary: Apiary
+        :param perm_type: 'read', 'update' or 'delete'
+        :type perm_type: str
+        :rtype: bool
+        """
+        if self.is_admin:
+            return True
+        if apiary.created_by_id and str(apiary.created_by_id) == self.guid:
+            return True
+        if perm_type not in ('read', 'update', 'delete') or not self.group_ids:
+            return False
+        return self.acl.allows(self.group_ids, apiary.pk, perm_type)
+
+
+def with_group_permissions(queryset):
+    """
+    Prefetch the group permissions of the apiaries with their groups, rendered by ApiarySerializer
+    (one query for all the apiaries instead of one per apiary).
+
+    :param queryset: The apiary queryset
+    :type queryset: QuerySet
+    :rtype: QuerySet
+    """
+    return queryset.prefetch_related(
+        Prefetch('apiarygrouppermission_set', queryset=ApiaryGroupPermission.objects.select_related('group'))
+    )
+
+
+def readable_apiaries(queryset, user):
+    """
+    Restrict an apiary queryset to the apiaries the user can read:
+    all of them for admins, otherwise their own apiaries and the apiaries readable by one of their groups.
+    The membership paths of the user are resolved to group ids with the compiled ACL index (see hornet.acl),
+    and the group rule is an EXISTS subquery on the permissions of these groups, whose size does not depend
+    on the number of readable apiaries.
+
+    :param queryset: The apiary queryset
+    :type queryset: QuerySet
+    :param user: The authenticated user
+    :type user: JWTUser
+    :return: The restricted queryset
+    :rtype: QuerySet
+    """
+    if 'admin' in getattr(user, 'roles', []):
+        return queryset
+    owned = Q(created_by_id=getattr(user, 'guid', None))
+    group_ids = apiary_acl.current().group_ids(get_membership_paths(user))
+    if not group_ids:
+        return queryset.filter(owned)
+    readable_by_group = Exists(ApiaryGroupPermission.objects.filter(
+        apiary=OuterRef('pk'), group_id__in=sorted(group_ids), can_read=True,
+    ))
+    return queryset.filter(owned | readable_by_group)
+
+
+def readable_tombstones(queryset, user):
+    """
+    Restrict a queryset of apiary tombstones to the deleted apiaries the user could read, with the same rules
+    as readable_apiaries applied to the owner and the reading groups recorded at deletion.
+    Tombstones recorded without them are only visible to admins.
+
+    :param queryset: The tombstone queryset
+    :type queryset: QuerySet
+    :param user: The authenticated user
+    :type user: JWTUser
+    :return: The restricted queryset
+    :rtype: QuerySet
+    """
+    if 'admin' in getattr(user, 'roles', []):
+        return queryset
+    guid = getattr(user, 'guid', None)
+    # A null owner must not match the tombstones recorded without one
+    visible = Q(created_by=guid) if guid else Q(pk__in=[])
+    group_ids = apiary_acl.current().group_ids(get_membership_paths(user))
+    if group_ids:
+        visible |= Q(read_group_ids__overlap=sorted(group_ids))
+    return queryset.filter(visible)
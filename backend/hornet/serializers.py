@@ -1,6 +1,8 @@
+import uuid
 from rest_framework import serializers
+from django.db import models
 from .models import Hornet, Nest, Apiary, User
-from hornet_finder_api.utils import user_exists, get_user_display_name
+from hornet_finder_api.utils import user_exists, get_user_display_name, get_user_display_names
 
 class GPSValidationMixin:
     def validate_longitude(self, value: float) -> float:
@@ -12,16 +14,107 @@ class GPSValidationMixin:
         if not (-90 <= value <= 90):
             raise serializers.ValidationError("Latitude must be between -90 and 90 degrees.")
         return value
-    
-    def validate_created_by(self, value: str) -> str:
-        if not user_exists(value):
-            raise serializers.ValidationError("User does not exist.")
-        return value
 
-class HornetSerializer(GPSValidationMixin, serializers.ModelSerializer):
-    created_by = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+
+class KeycloakUserField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field for the local User model that also accepts the Keycloak users not known locally yet.
+    The local table is checked first and Keycloak is only called on a miss. A user known only by Keycloak
+    is returned unsaved: it is created by LocalUserCreationMixin when the serializer is saved, so that
+    a failed validation never writes to the database.
+    """
+    default_error_messages = {
+        'does_not_exist': 'User does not exist.',
+    }
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', User.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        try:
+            guid = uuid.UUID(str(data))
+        except (TypeError, ValueError, AttributeError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        user = self.get_queryset().filter(pk=guid).first()
+        if user is not None:
+            return user
+        if not user_exists(str(guid)):
+            self.fail('does_not_exist', pk_value=data)
+        return User(guid=guid)
+
+
+class LocalUserCreationMixin:
+    """
+    Creates the local users returned unsaved by KeycloakUserField before the instance is created or updated.
+    A created_by given to save() (e.g. the authenticated user in perform_create) replaces the validated one,
+    which is then not created.
+    """
+
+    @staticmethod
+    def _create_local_users(validated_data):
+        user = validated_data.get('created_by')
+        if user is not None and user._state.adding:
+            validated_data['created_by'], _ = User.objects.get_or_create(guid=user.guid)
+
+    def create(self, validated_data):
+        self._create_local_users(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self._create_local_users(validated_data)
+        return super().update(instance, validated_data)
+
+
+class CreatedByListSerializer(serializers.ListSerializer):
+    """
+    List serializer that resolves the display names of all the distinct creators without a local profile
+    in one batch before serializing the rows, instead of one Keycloak lookup per row.
+    The queryset should use select_related('created_by').
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        items = list(iterable)
+        # Only the creators whose profile was never stored locally need a Keycloak lookup
+        self.child.display_names = get_user_display_names(
+            item.created_by_id for item in items
+            if item.created_by_id and not item.created_by.profile_synced_at
+        )
+        return [self.child.to_representation(item) for item in items]
+
+
+class CreatedByDisplayNameMixin:
+    """
+    Renders the created_by field as {'guid', 'display_name'}.
+    The display name comes from the local User profile; Keycloak is only queried for users that were never synced.
+    When used with CreatedByListSerializer, the names resolved in batch by the list serializer are used.
+    """
+    display_names = None
+
+    def get_created_by_representation(self, instance):
+        user = instance.created_by
+        if user is None:
+            return None
+        guid = str(user.guid)
+        if user.profile_synced_at:
+            display_name = user.display_name
+        elif self.display_names is not None and guid in self.display_names:
+            display_name = self.display_names[guid]
+        else:
+            display_name = get_user_display_name(guid)
+        return {
+            'guid': guid,
+            'display_name': display_name or guid[:8] + '...'
+        }
+
+
+class HornetSerializer(LocalUserCreationMixin, CreatedByDisplayNameMixin, GPSValidationMixin, serializers.ModelSerializer):
+    created_by = KeycloakUserField(required=False)
     class Meta:
         model = Hornet
+        list_serializer_class = CreatedByListSerializer
         fields = ['id', 'longitude', 'latitude', 'direction', 'duration', 'mark_color_1', 'mark_color_2', 'created_at', 'created_by', 'linked_nest']
         read_only_fields = ['id', 'created_at']
         extra_kwargs = { # Adding this to make the validation limits understandable by the swagger
@@ -37,14 +130,7 @@ class HornetSerializer(GPSValidationMixin, serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super().to_representation(instance)
         # Enrichir le champ created_by avec le display_name Keycloak
-        if instance.created_by:
-            display_name = get_user_display_name(str(instance.created_by.guid))
-            data['created_by'] = {
-                'guid': str(instance.created_by.guid),
-                'display_name': display_name or str(instance.created_by.guid)[:8] + '...'
-            }
-        else:
-            data['created_by'] = None
+        data['created_by'] = self.get_created_by_representation(instance)
         return data
 
     def validate_direction(self, value: int) -> int:
@@ -58,25 +144,29 @@ class HornetSerializer(GPSValidationMixin, serializers.ModelSerializer):
         return value
 
 
+class HornetBulkItemSerializer(HornetSerializer):
+    """
+    Item of POST /api/hornets/bulk/. The creator is the authenticated user and new hornets are not linked to a nest,
+    so these fields are not read from the input, which avoids a user and a nest lookup per item.
+    """
+    created_by = serializers.HiddenField(default=None)
 
-class NestSerializer(GPSValidationMixin, serializers.ModelSerializer):
-    created_by = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+    class Meta(HornetSerializer.Meta):
+        read_only_fields = ['id', 'created_at', 'linked_nest']
+
+
+class NestSerializer(LocalUserCreationMixin, CreatedByDisplayNameMixin, GPSValidationMixin, serializers.ModelSerializer):
+    created_by = KeycloakUserField(required=False)
     class Meta:
         model = Nest
+        list_serializer_class = CreatedByListSerializer
         fields = ['id', 'longitude', 'latitude', 'public_place', 'address', 'destroyed', 'destroyed_at', 'created_at', 'created_by', 'comments']
         read_only_fields = ['id', 'created_at']
     
     def to_representation(self, instance):
         data = super().to_representation(instance)
         # Enrichir le champ created_by avec le display_name Keycloak
-        if instance.created_by:
-            display_name = get_user_display_name(str(instance.created_by.guid))
-            data['created_by'] = {
-                'guid': str(instance.created_by.guid),
-                'display_name': display_name or str(instance.created_by.guid)[:8] + '...'
-            }
-        else:
-            data['created_by'] = None
+        data['created_by'] = self.get_created_by_representation(instance)
         return data
 
     def validate_address(self, value: str) -> str:
@@ -99,28 +189,25 @@ class PublicNestSerializer(GPSValidationMixin, serializers.ModelSerializer):
         fields = ['id', 'longitude', 'latitude', 'public_place', 'address', 'destroyed', 'destroyed_at', 'created_at', 'comments']
         read_only_fields = ['id', 'created_at']
 
-class ApiarySerializer(GPSValidationMixin, serializers.ModelSerializer):
-    created_by = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+class ApiarySerializer(LocalUserCreationMixin, CreatedByDisplayNameMixin, GPSValidationMixin, serializers.ModelSerializer):
+    created_by = KeycloakUserField(required=False)
 
     class Meta:
         model = Apiary
+        list_serializer_class = CreatedByListSerializer
         fields = ['id', 'longitude', 'latitude', 'infestation_level', 'created_at', 'created_by', 'comments']
         read_only_fields = ['id', 'created_at']
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
         # Enrichir le champ created_by avec le display_name Keycloak
-        if instance.created_by:
-            display_name = get_user_display_name(str(instance.created_by.guid))
-            data['created_by'] = {
-                'guid': str(instance.created_by.guid),
-                'display_name': display_name or str(instance.created_by.guid)[:8] + '...'
-            }
-        else:
-            data['created_by'] = None
+        data['created_by'] = self.get_created_by_representation(instance)
         # Ajout du champ extended_permissions avec le nom fancy
+        permissions = instance.apiarygrouppermission_set.all()
+        if 'apiarygrouppermission_set' not in getattr(instance, '_prefetched_objects_cache', {}):
+            permissions = permissions.select_related('group')  # Not prefetched (see permissions.with_group_permissions)
         perms = []
-        for agp in instance.apiarygrouppermission_set.select_related('group').all():
+        for agp in permissions:
             perms.append({
                 'group': agp.group.path,
                 'group_name': agp.group.name,  # nom fancy
@@ -0,0 +1,65 @@
+"""
+Invalidation of the geographic response cache (see hornet.geocache) when hornets and nests change,
+and tombstones of the deleted rows for the incremental sync of the list endpoints.
+The ACL index of the apiary permissions follows the changes through database triggers (see hornet.acl).
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .geocache import invalidate_namespace, invalidate_point
+from .models import Apiary, ApiaryGroupPermission, Hornet, Nest, Tombstone
+
+CACHE_NAMESPACES = {Hornet: 'hornets', Nest: 'nests'}
+
+
+def _invalidate_locations(instance):
+    namespace = CACHE_NAMESPACES[type(instance)]
+    invalidate_point(namespace, instance.latitude, instance.longitude)
+    loaded_location = getattr(instance, '_loaded_location', None)
+    if loaded_location and loaded_location != (instance.latitude, instance.longitude):
+        invalidate_point(namespace, *loaded_location)
+
+
+@receiver(post_save, sender=Hornet)
+@receiver(post_save, sender=Nest)
+def invalidate_saved_location(sender, instance, **kwargs):
+    _invalidate_locations(instance)
+    instance._loaded_location = (instance.latitude, instance.longitude)
+
+
+@receiver(post_delete, sender=Hornet)
+@receiver(post_delete, sender=Nest)
+def invalidate_deleted_location(sender, instance, **kwargs):
+    _invalidate_locations(instance)
+    if sender is Nest:
+        # The hornets linked to the nest are unlinked by an UPDATE, wherever they are
+        invalidate_namespace('hornets')
+
+
+@receiver(pre_delete, sender=Apiary)
+def load_apiary_read_groups(sender, instance, **kwargs):
+    # The group permissions are deleted in cascade before the apiary, keep the groups that could read it
+    instance._read_group_ids = list(
+        ApiaryGroupPermission.objects.filter(apiary=instance, can_read=True).values_list('group_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Hornet)
+@receiver(post_delete, sender=Nest)
+@receiver(post_delete, sender=Apiary)
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        model=sender._meta.model_name,
+        object_id=instance.pk,
+        point=instance.point,
+        created_by=instance.created_by_id,
+        read_group_ids=getattr(instance, '_read_group_ids', []),
+        destroyed=getattr(instance, 'destroyed', None),
+    )
+
+
+@receiver(pre_delete, sender=Nest)
+def touch_linked_hornets(sender, instance, **kwargs):
+    # The hornets are unlinked by an UPDATE that does not set updated_at, mark them as changed for the sync
+    Hornet.objects.filter(linked_nest=instance).update(updated_at=timezone.now())
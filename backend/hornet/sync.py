@@ -0,0 +1,50 @@
+"""
+Incremental sync of the list endpoints (`since` parameter).
+
+A sync returns the rows created or updated since a point in time (Hornet/Nest/Apiary.updated_at) and the ids of
+the rows deleted since then (Tombstone). The returned `next_since` cursor is the time the sync started, moved back
+by SYNC_OVERLAP_SECONDS: updated_at is set when a row is saved, before its transaction commits, so a row committed
+during the previous sync could otherwise be missed. Rows may thus be returned twice; clients upsert them by id.
+"""
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Overlap between two consecutive syncs, in seconds
+SYNC_OVERLAP_SECONDS = int(os.getenv("SYNC_OVERLAP_SECONDS", "5"))
+# Tombstones older than this are purged (purge_tombstones command): older cursors require a full refetch
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+
+
+def parse_since(value):
+    """
+    Parse a `since` parameter: an ISO 8601 datetime (as returned in next_since) or a Unix timestamp in seconds.
+
+    :param value: The parameter value
+    :type value: str
+    :return: The aware datetime, or None if the value is invalid
+    :rtype: datetime
+    """
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    try:
+        since = parse_datetime(value.replace(' ', '+'))  # An unencoded + in the query string is read as a space
+    except ValueError:
+        return None
+    if since is not None and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def is_expired(since):
+    """Whether the tombstones needed by a sync from `since` may have been purged."""
+    return since < timezone.now() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+
+
+def next_cursor():
+    """The `since` value of the next sync, to take before the rows are read."""
+    return timezone.now() - timedelta(seconds=SYNC_OVERLAP_SECONDS)
@@ -1,3 +1,783 @@
-from django.test import TestCase
+import json
+import math
+import time
+import uuid
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils import timezone
+from jwt.algorithms import RSAAlgorithm
+from keycloak.exceptions import KeycloakGetError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APITestCase
+
+from hornet_finder_api.authentication import JWKSCache, JWTBearerAuthentication, JWTUser
+from hornet_finder_api import utils
+from hornet_finder_api.utils import TTLCache
+
+from .acl import ApiaryACLIndex, apiary_acl
+from . import geometry
+from .geometry import MAGNETIC_DECLINATION_DEG, haversine_m
+from .models import Apiary, ApiaryGroupPermission, BeekeeperGroup, Hornet, Nest, User
+from .serializers import HornetSerializer
+from .views import MAX_BULK_HORNETS
+
+
+class ApiaryListQueryCountTests(APITestCase):
+    """The apiary list runs a constant number of queries, whatever the number of apiaries."""
+
+    def setUp(self):
+        # The database versions are rolled back after each test, the index of the process must not outlive them
+        apiary_acl.clear()
+        self.owner = User.objects.create(guid=uuid.uuid4(), display_name='Owner', profile_synced_at=timezone.now())
+        self.other = User.objects.create(guid=uuid.uuid4(), display_name='Other', profile_synced_at=timezone.now())
+        self.group = BeekeeperGroup.objects.create(name='VSAB', path='/beekeepers/vsab')
+        self.other_group = BeekeeperGroup.objects.create(name='Other', path='/beekeepers/other')
+
+    def _create_apiaries(self, count):
+        for index in range(count):
+            # Alternate owned apiaries and apiaries shared with the group of the user
+            owned = index % 2 == 0
+            apiary = Apiary.objects.create(
+                latitude=50.85 + index * 0.001, longitude=4.35, infestation_level=1,
+                created_by=self.owner if owned else self.other,
+            )
+            if not owned:
+                ApiaryGroupPermission.objects.create(apiary=apiary, group=self.group, can_read=True)
+                ApiaryGroupPermission.objects.create(apiary=apiary, group=self.other_group, can_read=True)
+
+    def _authenticate(self, roles, membership):
+        user = JWTUser({'sub': str(self.owner.guid), 'realm_access': {'roles': roles}, 'membership': membership}, self.owner)
+        self.client.force_authenticate(user=user)
+
+    def _assert_list_queries(self, roles, membership, queries):
+        self._authenticate(roles, membership)
+        for count in (2, 10):
+            Apiary.objects.all().delete()
+            self._create_apiaries(count)
+            # Rebuilds the ACL index of the process after the permission changes
+            self.client.get('/api/apiaries/', {'lat': 50.85, 'lon': 4.35, 'radius': 5})
+            with self.assertNumQueries(queries):
+                response = self.client.get('/api/apiaries/', {'lat': 50.85, 'lon': 4.35, 'radius': 5})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()), count)
+
+    def test_beekeeper_list_query_count(self):
+        # The ACL version, the apiaries with their creators, then their group permissions with the groups
+        self._assert_list_queries(['beekeeper'], ['/beekeepers/vsab'], 3)
+
+    def test_admin_list_query_count(self):
+        # Admins read all the apiaries, without the ACL
+        self._assert_list_queries(['admin'], [], 2)
+
+    def test_beekeeper_list_only_readable_apiaries(self):
+        self._create_apiaries(4)
+        hidden = Apiary.objects.create(latitude=50.85, longitude=4.35, infestation_level=2, created_by=self.other)
+        self._authenticate(['beekeeper'], ['/beekeepers/vsab'])
+        response = self.client.get('/api/apiaries/', {'lat': 50.85, 'lon': 4.35, 'radius': 5})
+        self.assertEqual(response.status_code, 200)
+        ids = {apiary['id'] for apiary in response.json()}
+        self.assertEqual(len(ids), 4)
+        self.assertNotIn(hidden.id, ids)
+
+    def test_beekeeper_list_honours_geographic_filter(self):
+        self._create_apiaries(2)
+        self._authenticate(['beekeeper'], ['/beekeepers/vsab'])
+        response = self.client.get('/api/apiaries/', {'lat': 10.0, 'lon': 10.0, 'radius': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        response = self.client.get('/api/apiaries/', {'lat': 50.85, 'lon': 4.35, 'radius': 50})
+        self.assertEqual(response.status_code, 403)
+
+
+class ApiaryDetailPermissionTests(APITestCase):
+    """The detail actions load the apiary once and check the permissions without extra queries."""
+
+    def setUp(self):
+        apiary_acl.clear()
+        self.owner = User.objects.create(guid=uuid.uuid4(), display_name='Owner', profile_synced_at=timezone.now())
+        self.user = User.objects.create(guid=uuid.uuid4(), display_name='User', profile_synced_at=timezone.now())
+        self.group = BeekeeperGroup.objects.create(name='VSAB', path='/beekeepers/vsab')
+        self.apiary = Apiary.objects.create(latitude=50.85, longitude=4.35, infestation_level=1, created_by=self.owner)
+        ApiaryGroupPermission.objects.create(apiary=self.apiary, group=self.group, can_read=True, can_update=False)
+        token_info = {'sub': str(self.user.guid), 'realm_access': {'roles': ['beekeeper']}, 'membership': ['/beekeepers/vsab']}
+        self.client.force_authenticate(user=JWTUser(token_info, self.user))
+        # Builds the ACL index of the process
+        self.client.get(f'/api/apiaries/{self.apiary.id}/')
+
+    def test_retrieve_with_group_read_permission(self):
+        # The apiary with its creator, its group permissions with the groups, then the ACL version
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/apiaries/{self.apiary.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['extended_permissions'][0]['group'], '/beekeepers/vsab')
+
+    def test_update_without_group_update_permission(self):
+        with self.assertNumQueries(3):
+            response = self.client.patch(f'/api/apiaries/{self.apiary.id}/', {'infestation_level': 3}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.apiary.refresh_from_db()
+        self.assertEqual(self.apiary.infestation_level, 1)
+
+    def test_group_change_applies_immediately(self):
+        self.group.path = '/beekeepers/renamed'
+        self.group.save()
+        response = self.client.get(f'/api/apiaries/{self.apiary.id}/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_revoked_permission_applies_immediately(self):
+        # No signal is sent by queryset.update: the database trigger bumps the ACL version
+        ApiaryGroupPermission.objects.filter(apiary=self.apiary).update(can_read=False)
+        response = self.client.get(f'/api/apiaries/{self.apiary.id}/')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GeographicResponseCacheTests(APITestCase):
+    """The public list responses are cached per tile, invalidated by the changes of their rows, and revalidated."""
+
+    AREA = {'lat': 50.85, 'lon': 4.35, 'radius': 2}
+
+    def setUp(self):
+        cache.clear()
+        self.hornet = Hornet.objects.create(latitude=50.85, longitude=4.35, direction=90, duration=60)
+
+    def _ids(self, response):
+        return {row['id'] for row in response.json()}
+
+    def test_conditional_requests(self):
+        response = self.client.get('/api/hornets/', self.AREA)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._ids(response), {self.hornet.id})
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get('/api/hornets/', self.AREA, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/hornets/', self.AREA, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get('/api/hornets/', self.AREA, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_saved_and_deleted_hornets_invalidate_their_tile(self):
+        etag = self.client.get('/api/hornets/', self.AREA)['ETag']
+        created = Hornet.objects.create(latitude=50.851, longitude=4.351, direction=180, duration=60)
+        response = self.client.get('/api/hornets/', self.AREA, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._ids(response), {self.hornet.id, created.id})
+
+        # Moved out of the area: the tiles of the old and of the new position are invalidated
+        created.latitude = 10.0
+        created.save()
+        self.assertEqual(self._ids(self.client.get('/api/hornets/', self.AREA)), {self.hornet.id})
+
+        self.hornet.delete()
+        self.assertEqual(self._ids(self.client.get('/api/hornets/', self.AREA)), set())
+
+    def test_saved_nests_invalidate_their_tile(self):
+        self.assertEqual(self._ids(self.client.get('/api/nests/destroyed/', self.AREA)), set())
+        nest = Nest.objects.create(latitude=50.85, longitude=4.35)
+        self.assertEqual(self._ids(self.client.get('/api/nests/destroyed/', self.AREA)), set())
+        nest.destroyed = True
+        nest.save()
+        self.assertEqual(self._ids(self.client.get('/api/nests/destroyed/', self.AREA)), {nest.id})
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        self.client.get('/api/hornets/', self.AREA)
+        # bulk_create sends no signal, so the cached anonymous response is not invalidated
+        created = Hornet(latitude=50.85, longitude=4.35, direction=0, duration=60)
+        created.update_geometries()
+        Hornet.objects.bulk_create([created])
+        self.assertEqual(self._ids(self.client.get('/api/hornets/', self.AREA)), {self.hornet.id})
+
+        user = User.objects.create(guid=uuid.uuid4(), display_name='Admin', profile_synced_at=timezone.now())
+        self.client.force_authenticate(user=JWTUser({'sub': str(user.guid), 'realm_access': {'roles': ['admin']}}, user))
+        response = self.client.get('/api/hornets/', self.AREA)
+        self.assertEqual(self._ids(response), {self.hornet.id, created.id})
+        self.assertFalse(response.has_header('ETag'))
+
+
+class ApiaryACLIndexTests(APITestCase):
+    """The ACL index only reloads the groups changed since its version, and matches a full build."""
+
+    def setUp(self):
+        apiary_acl.clear()
+        self.vsab = BeekeeperGroup.objects.create(name='VSAB', path='/beekeepers/vsab')
+        self.other = BeekeeperGroup.objects.create(name='Other', path='/beekeepers/other')
+        self.apiary = Apiary.objects.create(latitude=50.85, longitude=4.35, infestation_level=1)
+        ApiaryGroupPermission.objects.create(apiary=self.apiary, group=self.vsab, can_read=True)
+        ApiaryGroupPermission.objects.create(apiary=self.apiary, group=self.other, can_read=True, can_update=True)
+        apiary_acl.current()
+
+    def _assert_updated_incrementally(self):
+        with mock.patch.object(ApiaryACLIndex, '_build', side_effect=AssertionError('full build')):
+            snapshot = apiary_acl.current()
+        full = ApiaryACLIndex._build(snapshot.version)
+        for paths in (['/beekeepers/vsab'], ['/beekeepers/other'], ['/beekeepers/renamed'], ['/beekeepers/new']):
+            group_ids = snapshot.group_ids(paths)
+            self.assertEqual(group_ids, full.group_ids(paths))
+            for perm_type in ('read', 'update', 'delete'):
+                self.assertEqual(
+                    snapshot.allows(group_ids, self.apiary.id, perm_type), full.allows(group_ids, self.apiary.id, perm_type)
+                )
+        return snapshot
+
+    def test_permission_change(self):
+        ApiaryGroupPermission.objects.filter(group=self.vsab).update(can_read=False, can_delete=True)
+        snapshot = self._assert_updated_incrementally()
+        vsab = snapshot.group_ids(['/beekeepers/vsab'])
+        self.assertFalse(snapshot.allows(vsab, self.apiary.id, 'read'))
+        self.assertTrue(snapshot.allows(vsab, self.apiary.id, 'delete'))
+        self.assertTrue(snapshot.allows(snapshot.group_ids(['/beekeepers/other']), self.apiary.id, 'update'))
+
+    def test_group_changes(self):
+        self.vsab.path = '/beekeepers/renamed'
+        self.vsab.save()
+        self.other.delete()
+        new = BeekeeperGroup.objects.create(name='New', path='/beekeepers/new')
+        ApiaryGroupPermission.objects.create(apiary=self.apiary, group=new, can_read=True)
+        snapshot = self._assert_updated_incrementally()
+        self.assertEqual(snapshot.group_ids(['/beekeepers/vsab', '/beekeepers/other']), set())
+        self.assertTrue(snapshot.allows(snapshot.group_ids(['/beekeepers/renamed']), self.apiary.id, 'read'))
+        self.assertTrue(snapshot.allows(snapshot.group_ids(['/beekeepers/new']), self.apiary.id, 'read'))
+
+
+class GeographicParameterTests(APITestCase):
+    """Invalid search areas are rejected with 400 before any spatial or cache computation."""
+
+    def test_non_finite_circle_parameters(self):
+        for params in (
+            {'lat': 'nan', 'lon': 4.35},
+            {'lat': 50.85, 'lon': 'inf'},
+            {'lat': 50.85, 'lon': 4.35, 'radius': 'nan'},
+            {'lat': 50.85, 'lon': 4.35, 'radius': '-inf'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/hornets/', params).status_code, 400)
+                self.assertEqual(self.client.get('/api/nests/destroyed/', params).status_code, 400)
+
+    def test_out_of_range_circle_parameters(self):
+        self.assertEqual(self.client.get('/api/hornets/', {'lat': 91, 'lon': 4.35}).status_code, 400)
+        self.assertEqual(self.client.get('/api/hornets/', {'lat': 50.85, 'lon': 181}).status_code, 400)
+        self.assertEqual(self.client.get('/api/hornets/', {'lat': 50.85, 'lon': 4.35, 'radius': -1}).status_code, 400)
+
+    def test_non_finite_bbox(self):
+        self.assertEqual(self.client.get('/api/hornets/', {'bbox': '4.3,50.8,nan,50.9'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/hornets/', {'bbox': '-inf,50.8,4.4,50.9'}).status_code, 400)
+
+
+class SyncTombstoneVisibilityTests(APITestCase):
+    """The sync only reports the deletions of rows the user could see in the list."""
+
+    def setUp(self):
+        apiary_acl.clear()
+        self.owner = User.objects.create(guid=uuid.uuid4(), display_name='Owner', profile_synced_at=timezone.now())
+        self.other = User.objects.create(guid=uuid.uuid4(), display_name='Other', profile_synced_at=timezone.now())
+        self.group = BeekeeperGroup.objects.create(name='VSAB', path='/beekeepers/vsab')
+        self.since = timezone.now().isoformat()
+
+    def _create_apiary(self, created_by, group=None):
+        apiary = Apiary.objects.create(latitude=50.85, longitude=4.35, infestation_level=1, created_by=created_by)
+        if group is not None:
+            ApiaryGroupPermission.objects.create(apiary=apiary, group=group, can_read=True)
+        return apiary
+
+    def _deleted(self, url, params):
+        response = self.client.get(url, {'lat': 50.85, 'lon': 4.35, 'radius': 5, 'since': self.since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['deleted']
+
+    def test_apiary_sync_hides_unreadable_deletions(self):
+        owned = self._create_apiary(self.owner)
+        shared = self._create_apiary(self.other, self.group)
+        hidden = self._create_apiary(self.other)
+        ids = [owned.id, shared.id, hidden.id]
+        Apiary.objects.filter(id__in=ids).delete()
+
+        token_info = {'sub': str(self.owner.guid), 'realm_access': {'roles': ['beekeeper']}, 'membership': ['/beekeepers/vsab']}
+        self.client.force_authenticate(user=JWTUser(token_info, self.owner))
+        self.assertEqual(self._deleted('/api/apiaries/', {}), sorted([owned.id, shared.id]))
+
+        token_info = {'sub': str(self.other.guid), 'realm_access': {'roles': ['admin']}, 'membership': []}
+        self.client.force_authenticate(user=JWTUser(token_info, self.other))
+        self.assertEqual(self._deleted('/api/apiaries/', {}), sorted(ids))
+
+    def test_destroyed_nest_sync_hides_active_deletions(self):
+        destroyed = Nest.objects.create(latitude=50.85, longitude=4.35, destroyed=True, created_by=self.owner)
+        active = Nest.objects.create(latitude=50.85, longitude=4.35, created_by=self.owner)
+        destroyed_id, active_id = destroyed.id, active.id
+        destroyed.delete()
+        active.delete()
+        self.assertEqual(self._deleted('/api/nests/destroyed/', {}), [destroyed_id])
+
+
+def _rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _jwks(*keys):
+    """Key set of the realm for the (kid, private key) pairs."""
+    jwks = []
+    for kid, private_key in keys:
+        jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+        jwk.update(kid=kid, use='sig')
+        jwks.append(jwk)
+    return {'keys': jwks}
+
+
+def _token(private_key, kid, lifetime=300, **claims):
+    payload = {'sub': str(uuid.uuid4()), 'aud': 'account', 'exp': int(time.time()) + lifetime, **claims}
+    return jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': kid})
+
+
+class VerifiedTokenCacheTests(APITestCase):
+    """The cache of the verified tokens never serves a token the signature check would reject."""
+
+    def setUp(self):
+        self.key = _rsa_key()
+        self.key_set = _jwks(('k1', self.key))
+        self.authentication = JWTBearerAuthentication()
+        self.authentication.jwks = JWKSCache(lambda: self.key_set, min_refresh_interval=0)
+        JWTBearerAuthentication.verified_tokens.clear()
+        JWTBearerAuthentication.known_users.clear()
+
+    def _authenticate(self, token):
+        request = RequestFactory().get('/api/apiaries/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.authentication.authenticate(request)
+
+    def test_second_request_is_a_cache_hit(self):
+        token = _token(self.key, 'k1')
+        self._authenticate(token)
+        hits = JWTBearerAuthentication.verified_tokens.stats()['hits']
+        with mock.patch('hornet_finder_api.authentication.jwt.decode', wraps=jwt.decode) as decode:
+            self._authenticate(token)
+        decode.assert_not_called()
+        self.assertEqual(JWTBearerAuthentication.verified_tokens.stats()['hits'], hits + 1)
+
+    def test_token_not_served_after_expiration(self):
+        token = _token(self.key, 'k1', exp=int(time.time()) + 60)
+        self._authenticate(token)
+        # Past the expiration on the cache clock: the token is verified again, and rejected as expired
+        after_expiration = time.monotonic() + 61
+        with mock.patch.object(utils.time, 'monotonic', return_value=after_expiration), \
+                mock.patch('hornet_finder_api.authentication.jwt.decode', side_effect=jwt.ExpiredSignatureError) as decode:
+            with self.assertRaises(AuthenticationFailed):
+                self._authenticate(token)
+        decode.assert_called_once()
+
+    def test_other_signature_is_not_a_cache_hit(self):
+        token = _token(self.key, 'k1')
+        self._authenticate(token)
+        header, payload, _ = token.split('.')
+        _, _, forged_signature = jwt.encode(
+            jwt.decode(token, options={'verify_signature': False}), _rsa_key(), algorithm='RS256', headers={'kid': 'k1'}
+        ).split('.')
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate(f'{header}.{payload}.{forged_signature}')
+
+    def test_known_user_entry_expires_after_its_ttl(self):
+        token = _token(self.key, 'k1', preferred_username='volunteer')
+        self._authenticate(token)
+        guid = jwt.decode(token, options={'verify_signature': False})['sub']
+        with mock.patch.object(JWTBearerAuthentication.known_users, 'set') as known_users_set:
+            self._authenticate(token)
+        # A cached user is not stored again, so its entry is not extended by each request
+        known_users_set.assert_not_called()
+        self.assertIsNot(JWTBearerAuthentication.known_users.get(guid), TTLCache.MISSING)
+
+    def test_key_rotation(self):
+        self._authenticate(_token(self.key, 'k1'))
+        new_key = _rsa_key()
+        self.key_set = _jwks(('k2', new_key))
+        user, _ = self._authenticate(_token(new_key, 'k2'))
+        self.assertIsNotNone(user.local_user)
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate(_token(self.key, 'k1', lifetime=600))
+
+
+@mock.patch('hornet.serializers.user_exists', return_value=True)
+class KeycloakUserFieldTests(APITestCase):
+    """A creator known only by Keycloak is created locally when the serializer is saved, not during validation."""
+
+    def _serializer(self, guid, **data):
+        return HornetSerializer(data={'latitude': 50.85, 'longitude': 4.35, 'direction': 90, 'duration': 60, 'created_by': str(guid), **data})
+
+    def test_invalid_payload_does_not_create_the_user(self, user_exists):
+        guid = uuid.uuid4()
+        self.assertFalse(self._serializer(guid, direction=400).is_valid())
+        self.assertFalse(User.objects.filter(guid=guid).exists())
+
+    def test_save_creates_the_user(self, user_exists):
+        guid = uuid.uuid4()
+        serializer = self._serializer(guid)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertFalse(User.objects.filter(guid=guid).exists())
+        hornet = serializer.save()
+        self.assertEqual(hornet.created_by_id, guid)
+        self.assertTrue(User.objects.filter(guid=guid).exists())
+
+    def test_save_with_another_creator_does_not_create_the_user(self, user_exists):
+        owner = User.objects.create(guid=uuid.uuid4())
+        guid = uuid.uuid4()
+        serializer = self._serializer(guid)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save(created_by=owner, linked_nest=None).created_by_id, owner.guid)
+        self.assertFalse(User.objects.filter(guid=guid).exists())
+
+
+class HornetBulkCreateTests(APITestCase):
+    """The valid items of a bulk request are created and the others are reported with their index."""
+
+    def setUp(self):
+        self.user = User.objects.create(guid=uuid.uuid4(), display_name='Volunteer', profile_synced_at=timezone.now())
+        token_info = {'sub': str(self.user.guid), 'realm_access': {'roles': ['volunteer']}}
+        self.client.force_authenticate(user=JWTUser(token_info, self.user))
+
+    def _hornet(self, **data):
+        return {'latitude': 50.85, 'longitude': 4.35, 'direction': 90, 'duration': 60, **data}
+
+    def _post(self, data):
+        return self.client.post('/api/hornets/bulk/', data, format='json')
+
+    def test_all_items_created(self):
+        response = self._post([self._hornet(), self._hornet(direction=180)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['created']), 2)
+        self.assertEqual(response.json()['errors'], [])
+        self.assertEqual(Hornet.objects.filter(created_by=self.user).count(), 2)
+
+    def test_partial_validation(self):
+        response = self._post([self._hornet(), self._hornet(direction=400), self._hornet(latitude=None)])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.json()['created']), 1)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2])
+        self.assertIn('direction', response.json()['errors'][0]['errors'])
+        self.assertEqual(Hornet.objects.count(), 1)
+
+    def test_all_items_invalid(self):
+        response = self._post([self._hornet(direction=-1), 'not a hornet'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], [])
+        self.assertEqual(len(response.json()['errors']), 2)
+        self.assertFalse(Hornet.objects.exists())
+
+    def test_invalid_requests(self):
+        for data in ([], self._hornet(), [self._hornet()] * (MAX_BULK_HORNETS + 1)):
+            with self.subTest(items=len(data)):
+                response = self._post(data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertFalse(Hornet.objects.exists())
+
+
+class JWKSCacheTests(APITestCase):
+    """The realm keys are looked up by kid and only fetched again, at a limited rate, for an unknown kid."""
+
+    def setUp(self):
+        self.key = _rsa_key()
+        self.fetch = mock.Mock(return_value=_jwks(('k1', self.key), ('k2', _rsa_key())))
+
+    def test_lookup_by_kid(self):
+        jwks = JWKSCache(self.fetch)
+        jwks.warm_up()
+        token = _token(self.key, 'k1')
+        self.assertEqual(
+            jwks.get_signing_key(token).public_numbers(), self.key.public_key().public_numbers()
+        )
+        jwks.get_signing_key(_token(self.key, 'k2'))
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(jwks.stats(), {'keys': 2, 'refreshes': 1})
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        jwks = JWKSCache(self.fetch, min_refresh_interval=60)
+        jwks.warm_up()
+        for kid in ('unknown-1', 'unknown-2'):
+            with self.assertRaises(jwt.InvalidTokenError):
+                jwks.get_signing_key(_token(self.key, kid))
+        # Fetched at warm-up only: the unknown kids came within min_refresh_interval
+        self.assertEqual(self.fetch.call_count, 1)
+
+        jwks = JWKSCache(self.fetch, min_refresh_interval=0)
+        jwks.warm_up()
+        with self.assertRaises(jwt.InvalidTokenError):
+            jwks.get_signing_key(_token(self.key, 'unknown'))
+        self.assertEqual(self.fetch.call_count, 3)
+
+    def test_warm_up_failure(self):
+        self.fetch.side_effect = [ConnectionError('Keycloak is down'), self.fetch.return_value]
+        jwks = JWKSCache(self.fetch, min_refresh_interval=60)
+        with self.assertLogs('hornet_finder_api.authentication', level='WARNING'):
+            jwks.warm_up()
+        # The keys are fetched on first use, the failed warm-up does not count for the rate limit
+        self.assertIsNotNone(jwks.get_signing_key(_token(self.key, 'k1')))
+        self.assertEqual(self.fetch.call_count, 2)
+
+
+class DisplayNameLookupTests(SimpleTestCase):
+    """Only the users reported as not found by Keycloak are cached as unknown, not the Keycloak failures."""
+
+    def setUp(self):
+        utils._display_name_cache.clear()
+        self.admin = mock.Mock()
+        patcher = mock.patch.object(utils, '_get_keycloak_admin', return_value=self.admin)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unknown_users_are_cached(self):
+        known, unknown = str(uuid.uuid4()), str(uuid.uuid4())
+
+        def get_user(guid):
+            if guid == unknown:
+                raise KeycloakGetError('User not found', response_code=404)
+            return {'id': guid, 'username': 'jdoe', 'firstName': 'John', 'lastName': 'Doe'}
+
+        self.admin.get_user.side_effect = get_user
+        self.assertEqual(utils.get_user_display_names([known, unknown]), {known: 'John Doe', unknown: None})
+        self.assertEqual(utils.get_user_display_names([known, unknown]), {known: 'John Doe', unknown: None})
+        self.assertEqual(self.admin.get_user.call_count, 2)
+
+    def test_keycloak_failures_are_not_cached(self):
+        guids = [str(uuid.uuid4()), str(uuid.uuid4())]
+        for error in (KeycloakGetError('Service unavailable', response_code=503), ConnectionError('Timeout')):
+            with self.subTest(error=error):
+                self.admin.get_user.side_effect = error
+                with self.assertLogs('hornet_finder_api.utils', level='WARNING'):
+                    self.assertEqual(utils.get_user_display_names(guids), dict.fromkeys(guids))
+                self.assertIs(utils._display_name_cache.get(guids[0]), TTLCache.MISSING)
+
+
+def _tile_of(lat, lon, z):
+    """XYZ coordinates of the Web Mercator tile containing a point."""
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return z, x, y
+
+
+class VectorTileTests(APITestCase):
+    """The vector tiles are rendered by PostGIS with the access rules of the list endpoints."""
+
+    def setUp(self):
+        apiary_acl.clear()
+        self.user = User.objects.create(guid=uuid.uuid4(), display_name='Admin', profile_synced_at=timezone.now())
+        Hornet.objects.create(latitude=50.85, longitude=4.35, direction=90, duration=60)
+        Nest.objects.create(latitude=50.85, longitude=4.35)
+        Apiary.objects.create(latitude=50.85, longitude=4.35, infestation_level=2, created_by=self.user)
+        self.url = '/api/tiles/{}/%d/%d/%d.mvt' % _tile_of(50.85, 4.35, 14)
+
+    def _login(self, roles):
+        self.client.force_authenticate(user=JWTUser({'sub': str(self.user.guid), 'realm_access': {'roles': roles}}, self.user))
+
+    def test_anonymous_hornet_tile(self):
+        response = self.client.get(self.url.format('hornets'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn('public', response['Cache-Control'])
+        # The layer name is encoded in the tile when it has features
+        self.assertIn(b'hornets', response.content)
+
+    def test_empty_tile(self):
+        z, x, y = _tile_of(10.0, 10.0, 14)
+        response = self.client.get(f'/api/tiles/hornets/{z}/{x}/{y}.mvt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+
+    def test_nest_layer_visibility(self):
+        # The public only sees the destroyed nests
+        self.assertEqual(self.client.get(self.url.format('nests')).content, b'')
+        self._login(['volunteer'])
+        response = self.client.get(self.url.format('nests'))
+        self.assertIn(b'nests', response.content)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_apiary_layer_visibility(self):
+        self.assertEqual(self.client.get(self.url.format('apiaries')).status_code, 403)
+        self._login(['volunteer'])
+        self.assertEqual(self.client.get(self.url.format('apiaries')).status_code, 403)
+        self._login(['beekeeper'])
+        self.assertIn(b'apiaries', self.client.get(self.url.format('apiaries')).content)
+
+    def test_invalid_tiles(self):
+        self.assertEqual(self.client.get('/api/tiles/unknown/14/0/0.mvt').status_code, 404)
+        self.assertEqual(self.client.get('/api/tiles/hornets/14/16384/0.mvt').status_code, 400)
+        # Low zoom tiles are larger than the public area
+        self.assertEqual(self.client.get('/api/tiles/hornets/%d/%d/%d.mvt' % _tile_of(50.85, 4.35, 8)).status_code, 403)
+        self._login(['admin'])
+        self.assertEqual(self.client.get('/api/tiles/hornets/%d/%d/%d.mvt' % _tile_of(50.85, 4.35, 8)).status_code, 200)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ClusterTests(APITestCase):
+    """The cluster parameter aggregates the rows of the area into grid cells with a breakdown by category."""
+
+    AREA = {'lat': 50.85, 'lon': 4.35, 'radius': 5}
+
+    def setUp(self):
+        cache.clear()
+        Hornet.objects.create(latitude=50.85, longitude=4.35, direction=90, mark_color_1='red')
+        Hornet.objects.create(latitude=50.85, longitude=4.35, direction=90, mark_color_1='red', mark_color_2='blue')
+        Hornet.objects.create(latitude=50.86, longitude=4.35, direction=90)
+
+    def test_hornet_clusters(self):
+        response = self.client.get('/api/hornets/', {**self.AREA, 'cluster': 16})
+        self.assertEqual(response.status_code, 200)
+        clusters = response.json()
+        self.assertEqual([cluster['count'] for cluster in clusters], [2, 1])
+        self.assertEqual(clusters[0]['breakdown'], {'red': 2, 'blue': 1})
+        self.assertEqual(clusters[1]['breakdown'], {'none': 1})
+        self.assertAlmostEqual(clusters[0]['latitude'], 50.85, places=5)
+        self.assertAlmostEqual(clusters[0]['longitude'], 4.35, places=5)
+
+    def test_low_zoom_merges_the_clusters(self):
+        clusters = self.client.get('/api/hornets/', {**self.AREA, 'cluster': 5}).json()
+        self.assertEqual([cluster['count'] for cluster in clusters], [3])
+        self.assertEqual(clusters[0]['breakdown'], {'red': 2, 'blue': 1, 'none': 1})
+
+    def test_destroyed_nest_clusters(self):
+        Nest.objects.create(latitude=50.85, longitude=4.35, destroyed=True)
+        Nest.objects.create(latitude=50.85, longitude=4.35)
+        clusters = self.client.get('/api/nests/destroyed/', {**self.AREA, 'cluster': 16}).json()
+        self.assertEqual(clusters, [{'latitude': clusters[0]['latitude'], 'longitude': clusters[0]['longitude'], 'count': 1, 'breakdown': {'destroyed': 1}}])
+
+    def test_invalid_zoom(self):
+        for zoom in ('abc', -1, 23):
+            with self.subTest(zoom=zoom):
+                self.assertEqual(self.client.get('/api/hornets/', {**self.AREA, 'cluster': zoom}).status_code, 400)
+
+
+class HotspotTests(APITestCase):
+    """The hotspots are the cells covered by the most return cones."""
+
+    BBOX = '4.33,50.83,4.37,50.87'
+
+    def setUp(self):
+        user = User.objects.create(guid=uuid.uuid4(), display_name='Volunteer', profile_synced_at=timezone.now())
+        self.client.force_authenticate(user=JWTUser({'sub': str(user.guid), 'realm_access': {'roles': ['volunteer']}}, user))
+
+    def _hornet(self, lat, lon, bearing):
+        # The stored direction is magnetic, the cone follows the declination corrected bearing
+        return Hornet.objects.create(latitude=lat, longitude=lon, direction=round(bearing - MAGNETIC_DECLINATION_DEG) % 360)
+
+    def test_cones_crossing(self):
+        # Three cones converging on (50.85, 4.35): from the west, the east and the south
+        hornets = [self._hornet(50.85, 4.34, 90), self._hornet(50.85, 4.36, 270), self._hornet(50.84, 4.35, 0)]
+        response = self.client.get('/api/hornets/hotspots/', {'bbox': self.BBOX, 'cell_size': 25})
+        self.assertEqual(response.status_code, 200)
+        best = response.json()[0]
+        self.assertEqual(best['cone_count'], 3)
+        self.assertEqual(best['hornet_ids'], sorted(hornet.id for hornet in hornets))
+        self.assertLess(haversine_m(best['latitude'], best['longitude'], 50.85, 4.35), 100)
+
+    def test_single_cone(self):
+        self._hornet(50.85, 4.34, 90)
+        response = self.client.get('/api/hornets/hotspots/', {'bbox': self.BBOX})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'bbox': self.BBOX, 'cell_size': 10}, {'bbox': self.BBOX, 'min_cones': 1}, {'bbox': self.BBOX, 'limit': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/hornets/hotspots/', params).status_code, 400)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/api/hornets/hotspots/', {'bbox': self.BBOX}).status_code, 403)
+
+
+def _bearing(lat1, lon1, lat2, lon2):
+    """Initial bearing from the first point to the second, in degrees."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_lambda = math.radians(lon2 - lon1)
+    y = math.sin(d_lambda) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(d_lambda)
+    return math.degrees(math.atan2(y, x)) % 360
+
+
+class ReturnConeTests(SimpleTestCase):
+    """The return cone starts at the hornet and follows the declination corrected direction."""
+
+    def _cone(self, direction, duration=None, declination=0):
+        with mock.patch.object(geometry, 'MAGNETIC_DECLINATION_DEG', declination):
+            ring = geometry.return_cone_polygon(50.85, 4.35, direction, duration).exterior_ring.coords
+        # Apex, left edge, axis and right edge vertices, as (lat, lon)
+        return [(lat, lon) for lon, lat in ring[:4]]
+
+    def test_length(self):
+        self.assertEqual(geometry.return_zone_length_m(None), geometry.RETURN_ZONE_DEFAULT_DISTANCE_M)
+        self.assertEqual(geometry.return_zone_length_m(0), geometry.RETURN_ZONE_DEFAULT_DISTANCE_M)
+        self.assertEqual(geometry.return_zone_length_m(600), 1000)  # 10 minutes at 100 m/min
+        self.assertEqual(geometry.return_zone_length_m(86400), geometry.RETURN_ZONE_ABSOLUTE_MAX_DISTANCE_M)
+
+    def test_orientation(self):
+        for direction in (0, 90, 180, 270, 45):
+            with self.subTest(direction=direction):
+                apex, left, axis, right = self._cone(direction, duration=600)
+                self.assertEqual(apex, (50.85, 4.35))
+                self.assertAlmostEqual(_bearing(*apex, *axis), direction % 360, delta=0.01)
+                self.assertAlmostEqual((_bearing(*apex, *right) - _bearing(*apex, *left)) % 360, geometry.RETURN_ZONE_ANGLE_DEG, delta=0.01)
+                self.assertAlmostEqual(haversine_m(*apex, *axis), 1000, delta=1)
+
+    def test_declination(self):
+        apex, _, axis, _ = self._cone(90, declination=10)
+        self.assertAlmostEqual(_bearing(*apex, *axis), 100, delta=0.01)
+        apex, _, axis, _ = self._cone(5, declination=-10)
+        self.assertAlmostEqual(_bearing(*apex, *axis), 355, delta=0.01)
+
+
+class ReturnZoneRecomputeTests(APITestCase):
+    """The stored return cone is only recomputed when the position, the direction or the duration change."""
+
+    def test_recompute_on_input_changes(self):
+        hornet = Hornet.objects.create(latitude=50.85, longitude=4.35, direction=90, duration=600)
+        self.assertIsNotNone(hornet.return_zone)
+        hornet = Hornet.objects.get(pk=hornet.pk)
+        with mock.patch('hornet.models.return_cone_polygon', wraps=geometry.return_cone_polygon) as compute:
+            hornet.mark_color_1 = 'red'
+            hornet.save()
+            compute.assert_not_called()
+            for field, value in (('direction', 180), ('duration', 1200), ('latitude', 50.86), ('longitude', 4.36)):
+                with self.subTest(field=field):
+                    compute.reset_mock()
+                    setattr(hornet, field, value)
+                    hornet.save()
+                    compute.assert_called_once_with(hornet.latitude, hornet.longitude, hornet.direction, hornet.duration)
+        hornet.refresh_from_db()
+        expected = geometry.return_cone_polygon(50.86, 4.36, 180, 1200)
+        self.assertTrue(hornet.return_zone.equals_exact(expected, tolerance=1e-9))
+
+
+class ListResponseFormatTests(APITestCase):
+    """Streaming and cursor pagination are opt-in and return the same rows as the plain JSON array."""
+
+    AREA = {'lat': 50.85, 'lon': 4.35, 'radius': 2}
+
+    def setUp(self):
+        self.hornets = [Hornet.objects.create(latitude=50.85, longitude=4.35, direction=direction, duration=60)
+                        for direction in (0, 90, 180)]
+        user = User.objects.create(guid=uuid.uuid4(), display_name='Admin', profile_synced_at=timezone.now())
+        self.client.force_authenticate(user=JWTUser({'sub': str(user.guid), 'realm_access': {'roles': ['admin']}}, user))
+
+    def test_plain_list_without_opt_in(self):
+        response = self.client.get('/api/hornets/', self.AREA)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual({row['id'] for row in response.json()}, {hornet.id for hornet in self.hornets})
+
+    @override_settings(SERVER_MODE='wsgi')
+    def test_stream(self):
+        plain = self.client.get('/api/hornets/', self.AREA).json()
+        with mock.patch('hornet.views.STREAM_CHUNK_SIZE', 2):
+            response = self.client.get('/api/hornets/', {**self.AREA, 'stream': 'true'})
+            body = b''.join(response.streaming_content)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(sorted(json.loads(body), key=lambda row: row['id']), sorted(plain, key=lambda row: row['id']))
+
+    def test_cursor_pagination(self):
+        response = self.client.get('/api/hornets/', {**self.AREA, 'page_size': 2})
+        page = response.json()
+        self.assertEqual([row['id'] for row in page['results']], [self.hornets[2].id, self.hornets[1].id])
+        self.assertIsNone(page['previous'])
+        self.assertIn('page_size=2', page['next'])
+        self.assertIn('radius=2', page['next'])
+
+        page = self.client.get(page['next']).json()
+        self.assertEqual([row['id'] for row in page['results']], [self.hornets[0].id])
+        self.assertIsNone(page['next'])
+        self.assertIsNotNone(page['previous'])
@@ -0,0 +1,87 @@
+"""
+Mapbox Vector Tiles (MVT) of the hornets, nests and apiaries, built by PostGIS with ST_AsMVT.
+"""
+import math
+
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+
+# Attributes exported in the tiles of each layer, besides the geometry
+LAYER_ATTRIBUTES = {
+    'hornets': ['id', 'direction', 'duration', 'mark_color_1', 'mark_color_2'],
+    'nests': ['id', 'destroyed', 'public_place'],
+    'apiaries': ['id', 'infestation_level'],
+}
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+TILE_SQL = """
+SELECT ST_AsMVT(tile, %s, {extent}, 'geom') FROM (
+    SELECT ST_AsMVTGeom(ST_Transform(item.point::geometry, 3857), ST_TileEnvelope(%s, %s, %s), {extent}, {buffer}, true) AS geom,
+           {attributes}
+    FROM {table} AS item
+    WHERE item.id IN ({ids})
+) AS tile
+WHERE geom IS NOT NULL
+"""
+
+
+def tile_bounds(z, x, y):
+    """
+    Bounds of a tile of the Web Mercator (XYZ) tiling scheme.
+
+    :return: tuple (min_lon, min_lat, max_lon, max_lat) in degrees
+    :rtype: tuple
+    """
+    n = 2 ** z
+
+    def lat(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return (x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+
+
+def tile_envelope(z, x, y):
+    """
+    Envelope of a tile, slightly enlarged to include the points drawn in the tile buffer.
+
+    :rtype: Polygon
+    """
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+    lon_margin = (max_lon - min_lon) * TILE_BUFFER / TILE_EXTENT
+    lat_margin = (max_lat - min_lat) * TILE_BUFFER / TILE_EXTENT
+    envelope = Polygon.from_bbox((
+        max(min_lon - lon_margin, -180), max(min_lat - lat_margin, -90),
+        min(max_lon + lon_margin, 180), min(max_lat + lat_margin, 90),
+    ))
+    envelope.srid = 4326
+    return envelope
+
+
+def render_tile(layer, queryset, z, x, y):
+    """
+    Render the rows of a queryset lying in a tile as a vector tile.
+    The queryset carries the access rules; it is filtered here by the tile envelope (point && envelope).
+
+    :param layer: The layer name, a key of LAYER_ATTRIBUTES
+    :type layer: str
+    :param queryset: The rows the user can see
+    :type queryset: QuerySet
+    :return: The encoded tile (empty if no row lies in the tile)
+    :rtype: bytes
+    """
+    ids_sql, ids_params = (
+        queryset.filter(point__bboverlaps=tile_envelope(z, x, y)).order_by().values('id').query.sql_with_params()
+    )
+    sql = TILE_SQL.format(
+        extent=TILE_EXTENT,
+        buffer=TILE_BUFFER,
+        attributes=', '.join(f'item.{attribute}' for attribute in LAYER_ATTRIBUTES[layer]),
+        table=queryset.model._meta.db_table,
+        ids=ids_sql,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [layer, z, x, y, *ids_params])
+        tile = cursor.fetchone()[0]
+    return bytes(tile) if tile else b''
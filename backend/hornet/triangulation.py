@@ -0,0 +1,92 @@
+"""
+Server-side triangulation of hornet nests from the return cones of the hornet observations.
+
+Each observation gives a cone starting at the hornet location, oriented by its (declination corrected) direction,
+and whose length depends on its absence duration. The nest is likely where many cones overlap.
+The cones are precomputed in Hornet.return_zone (spatially indexed) and rasterized by PostGIS on a square grid
+aligned on the origin, so that the cells of all the cones coincide; counting the cones per cell gives the
+intersection density in a single query.
+"""
+import math
+
+from django.db import connection
+
+from .geometry import haversine_m
+from .models import Hornet
+
+# Number of best cells considered before removing the cells too close to a better one
+CANDIDATE_CELLS = 500
+
+HOTSPOTS_SQL = """
+WITH cones AS (
+    SELECT id, ST_Transform(return_zone, 3857) AS geom
+    FROM {table}
+    WHERE return_zone && ST_MakeEnvelope(%(min_lon)s, %(min_lat)s, %(max_lon)s, %(max_lat)s, 4326)
+),
+cells AS (
+    SELECT cones.id AS hornet_id, grid.i, grid.j, grid.geom
+    FROM cones, ST_SquareGrid(%(cell_size)s, cones.geom) AS grid
+    WHERE ST_Intersects(grid.geom, cones.geom)
+),
+density AS (
+    SELECT i, j, count(DISTINCT hornet_id) AS cone_count, array_agg(DISTINCT hornet_id) AS hornet_ids,
+           ST_Transform(ST_Centroid((array_agg(geom))[1]), 4326) AS center
+    FROM cells
+    GROUP BY i, j
+    HAVING count(DISTINCT hornet_id) >= %(min_cones)s
+)
+SELECT ST_Y(center), ST_X(center), cone_count, hornet_ids
+FROM density
+WHERE center && ST_MakeEnvelope(%(min_lon)s, %(min_lat)s, %(max_lon)s, %(max_lat)s, 4326)
+ORDER BY cone_count DESC, i, j
+LIMIT %(candidates)s
+"""
+
+
+def find_nest_hotspots(bbox, cell_size_m=100, min_cones=2, limit=20, min_separation_m=None):
+    """
+    Rank the probable nest locations inside a bounding box by the number of hornet return cones covering them.
+
+    :param bbox: The region as (min_lon, min_lat, max_lon, max_lat)
+    :type bbox: tuple
+    :param cell_size_m: The size of the grid cells in meters
+    :type cell_size_m: float
+    :param min_cones: The minimum number of cones covering a cell to be a candidate
+    :type min_cones: int
+    :param limit: The maximum number of hotspots returned
+    :type limit: int
+    :param min_separation_m: The minimum distance between two hotspots in meters, defaults to 3 cells
+    :type min_separation_m: float
+    :return: The hotspots, best first, as dicts with latitude, longitude, cone_count and hornet_ids
+    :rtype: list
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if min_separation_m is None:
+        min_separation_m = 3 * cell_size_m
+
+    mid_lat = math.radians((min_lat + max_lat) / 2)
+    params = {
+        # Web Mercator units are stretched by 1 / cos(latitude)
+        'cell_size': cell_size_m / math.cos(mid_lat),
+        'min_cones': min_cones,
+        'candidates': CANDIDATE_CELLS,
+        'min_lon': min_lon, 'min_lat': min_lat, 'max_lon': max_lon, 'max_lat': max_lat,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(HOTSPOTS_SQL.format(table=Hornet._meta.db_table), params)
+        rows = cursor.fetchall()
+
+    # Keep the best cell of each area: cells next to a better ranked hotspot are the same hotspot
+    hotspots = []
+    for latitude, longitude, cone_count, hornet_ids in rows:
+        if any(haversine_m(latitude, longitude, h['latitude'], h['longitude']) < min_separation_m for h in hotspots):
+            continue
+        hotspots.append({
+            'latitude': latitude,
+            'longitude': longitude,
+            'cone_count': cone_count,
+            'hornet_ids': sorted(hornet_ids),
+        })
+        if len(hotspots) >= limit:
+            break
+    return hotspots
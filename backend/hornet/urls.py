@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import HornetViewSet, NestViewSet, ApiaryViewSet
+from .views import HornetViewSet, NestViewSet, ApiaryViewSet, VectorTileView
 
 
 router = DefaultRouter()
@@ -10,4 +11,14 @@ router.register(r'apiaries', ApiaryViewSet, basename='apiary')
 
 urlpatterns = [
     path('', include(router.urls)),
-]
\ No newline at end of file
+    path('tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt', VectorTileView.as_view(), name='vector-tile'),
+]
+
+if settings.SERVER_MODE == 'asgi':
+    # Async entry points of the public map endpoints, matched before the routes of the viewsets
+    from .async_views import hornet_list, destroyed_nest_list
+
+    urlpatterns = [
+        path('hornets/', hornet_list),
+        path('nests/destroyed/', destroyed_nest_list),
+    ] + urlpatterns
@@ -1,53 +1,458 @@
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.gis.measure import D
-from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import Point, Polygon
 from django.contrib.gis.db.models.functions import Distance
-
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
 from rest_framework import viewsets
+from rest_framework.views import APIView
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
-from .models import Hornet, Nest, Apiary, User, ApiaryGroupPermission, BeekeeperGroup
-from .serializers import HornetSerializer, NestSerializer, PublicNestSerializer, ApiarySerializer
+from .models import Hornet, Nest, Apiary, Tombstone
+from .serializers import HornetSerializer, HornetBulkItemSerializer, NestSerializer, PublicNestSerializer, ApiarySerializer
+from .pagination import GeographicCursorPagination
+from .triangulation import find_nest_hotspots
+from .linking import link_hornets_to_nests
+from .permissions import ACTION_PERMISSIONS, ApiaryPermissionResolver, readable_apiaries, readable_tombstones, with_group_permissions
+from .tiles import LAYER_ATTRIBUTES, render_tile, tile_bounds
+from .clustering import MAX_CLUSTER_ZOOM, cluster_queryset
+from .geocache import KM_PER_DEGREE_LAT, KM_PER_DEGREE_LON_AT_EQUATOR, circle_bbox, get_cached, get_or_render, invalidate_points, snap_bbox, snap_circle
+from .sync import TOMBSTONE_RETENTION_DAYS, is_expired, next_cursor, parse_since
 from hornet_finder_api.authentication import JWTBearerAuthentication, HasAnyRole
 from rest_framework import status
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotAuthenticated, NotFound, PermissionDenied, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Maximum search radius (km) for non-admin users, and the matching maximum area (km²) for bounding box searches
+MAX_PUBLIC_RADIUS_KM = 5
+MAX_PUBLIC_AREA_KM2 = math.pi * MAX_PUBLIC_RADIUS_KM ** 2
+# Number of rows fetched from the database and serialized at once in streaming mode
+STREAM_CHUNK_SIZE = 500
+# Maximum number of hornets accepted by one bulk create request
+MAX_BULK_HORNETS = 1000
+# Number of hornets inserted by each INSERT statement of a bulk create request
+BULK_CREATE_BATCH_SIZE = 500
+# Parameters whose responses are never served from the geographic response cache
+UNCACHED_LIST_PARAMS = ('cursor', 'page_size', 'stream', 'since')
+
+
+def _is_admin(request):
+    return bool(request.user and request.user.is_authenticated and 'admin' in getattr(request.user, 'roles', []))
+
+
+def _request_id(request):
+    """Id of the request set by nginx (X-Request-ID), to correlate the log records with the access log."""
+    return request.META.get('HTTP_X_REQUEST_ID', '-')
+
+
+def _bbox_area_km2(min_lon, min_lat, max_lon, max_lat):
+    """Approximate area of a bounding box, good enough at the scale of a map viewport."""
+    mid_lat = math.radians((min_lat + max_lat) / 2)
+    width_km = (max_lon - min_lon) * KM_PER_DEGREE_LON_AT_EQUATOR * math.cos(mid_lat)
+    height_km = (max_lat - min_lat) * KM_PER_DEGREE_LAT
+    return width_km * height_km
+
+
+def parse_circle_params(query_params, default_radius=5):
+    """
+    Parse and check the lat, lon and radius (km) parameters of a circle search.
+
+    :param query_params: The query parameters
+    :type query_params: QueryDict
+    :param default_radius: The default radius in km
+    :type default_radius: float
+    :return: tuple of ((lat, lon, radius) or None, error message or None)
+    :rtype: tuple
+    """
+    lat = query_params.get('lat')
+    lon = query_params.get('lon')
+    if not lat or not lon:
+        return None, "lat and lon (or bbox) parameters are required"
+    try:
+        lat, lon, radius = float(lat), float(lon), float(query_params.get('radius', default_radius))
+    except ValueError:
+        return None, "lat, lon and radius must be valid numbers"
+    # float() accepts 'nan' and 'inf', which would pass the comparisons below and break the spatial and cache math
+    if not all(math.isfinite(value) for value in (lat, lon, radius)):
+        return None, "lat, lon and radius must be valid numbers"
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, "lat must be between -90 and 90 and lon between -180 and 180"
+    if radius < 0:
+        return None, "radius must be positive"
+    return (lat, lon, radius), None
+
+
+def parse_bbox_params(query_params):
+    """
+    Parse and check the bbox=minLon,minLat,maxLon,maxLat parameter.
+
+    :param query_params: The query parameters
+    :type query_params: QueryDict
+    :return: tuple of ((min_lon, min_lat, max_lon, max_lat) or None, error message or None)
+    :rtype: tuple
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in query_params.get('bbox', '').split(','))
+    except ValueError:
+        return None, "bbox must be 4 comma-separated numbers: minLon,minLat,maxLon,maxLat"
+    # Also rejects nan and inf, for which every comparison is false
+    if not (-180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90):
+        return None, "bbox must satisfy -180 <= minLon < maxLon <= 180 and -90 <= minLat < maxLat <= 90"
+    return (min_lon, min_lat, max_lon, max_lat), None
+
+
+def get_cache_region(query_params, action, default_radius=5):
+    """
+    Snap the validated search area of a cached list request (see hornet.geocache).
+
+    :param query_params: The query parameters, already checked by parse_circle_params or parse_bbox_params
+    :type query_params: QueryDict
+    :param action: The viewset action, part of the cache key
+    :type action: str
+    :param default_radius: The default radius in km
+    :type default_radius: float
+    :return: tuple of (region, bbox): the cache key part of the snapped area, and its bounding box
+    :rtype: tuple
+    """
+    if query_params.get('bbox') is not None:
+        bbox = snap_bbox(parse_bbox_params(query_params)[0])
+        region = ('bbox',) + bbox
+    else:
+        lat, lon, radius = snap_circle(*parse_circle_params(query_params, default_radius)[0])
+        bbox = circle_bbox(lat, lon, radius)
+        region = ('circle', lat, lon, radius)
+    return region + (action, query_params.get('cluster')), bbox
+
+
+def is_public_cacheable(query_params, default_radius=5):
+    """
+    Whether a list request is valid and within the public limits, the only requests served by the response cache:
+    larger areas would cover too many invalidation tiles and fill the cache with large bodies.
+
+    :param query_params: The query parameters
+    :type query_params: QueryDict
+    :param default_radius: The default radius in km
+    :type default_radius: float
+    :rtype: bool
+    """
+    if any(name in query_params for name in UNCACHED_LIST_PARAMS):
+        return False
+    if query_params.get('bbox') is not None:
+        bbox, error = parse_bbox_params(query_params)
+        return error is None and _bbox_area_km2(*bbox) <= MAX_PUBLIC_AREA_KM2
+    circle, error = parse_circle_params(query_params, default_radius)
+    return error is None and circle[2] <= MAX_PUBLIC_RADIUS_KM
+
+
+def get_public_cached_entry(request, namespace, action, default_radius=5):
+    """
+    Look up the cached response of an anonymous request to a public cached list endpoint, without touching the database.
+    Returns None whenever the request must go through the viewset: authenticated, paginated or streamed requests,
+    parameters that are invalid or over the public limits (the viewset returns the error), and cache misses.
+
+    :param request: The HTTP request
+    :type request: HttpRequest
+    :param namespace: The cached endpoint family ('hornets' or 'nests')
+    :type namespace: str
+    :param action: The viewset action serving the endpoint
+    :type action: str
+    :return: The cache entry (see hornet.geocache.get_or_render), or None
+    :rtype: dict
+    """
+    if 'HTTP_AUTHORIZATION' in request.META or not is_public_cacheable(request.GET, default_radius):
+        return None
+    region, bbox = get_cache_region(request.GET, action, default_radius)
+    return get_cached(namespace, region, bbox)
+
+
+def get_cached_entry_response(request, entry):
+    """
+    Build the response of a cache entry, with its validators; conditional requests get 304 Not Modified.
+
+    :param request: The HTTP request
+    :type request: HttpRequest
+    :param entry: The cache entry (see hornet.geocache.get_or_render)
+    :type entry: dict
+    :rtype: HttpResponse
+    """
+    response = HttpResponse(entry['body'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    # Shared caches may store the response but must revalidate it, so that invalidations are seen
+    patch_cache_control(response, public=True, no_cache=True)
+    return get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'], response=response)
 
 
 class GeographicFilterMixin:
-    def get_geographic_queryset(self, request, default_radius=5):
+    def get_geographic_queryset(self, request, default_radius=5, queryset=None, with_distance=False):
         """
-        Filter the queryset by geographic distance
+        Filter the queryset by geographic distance (lat, lon and radius parameters)
+        or by bounding box (bbox=minLon,minLat,maxLon,maxLat parameter).
+        The radius filter uses ST_DWithin, which is answered by the GiST index on point;
+        the distance to the center is only computed when with_distance is set.
 
         :param request: The HTTP request
         :type request: HttpRequest
         :param default_radius: The default radius in km
         :type default_radius: float
+        :param queryset: The queryset to filter, defaults to the viewset queryset
+        :type queryset: QuerySet
+        :param with_distance: Annotate the rows with their distance to the center (radius filter only)
+        :type with_distance: bool
         :return: tuple of (filtered_queryset, error_response_or_None)
         :rtype: tuple
         """
-        lat = request.query_params.get('lat')
-        lon = request.query_params.get('lon')
-        radius = request.query_params.get('radius', default_radius)
-        
-        if not lat or not lon:
-            return None, Response({"error": "lat and lon parameters are required"}, status=400)
-        
-        try:
-            lat = float(lat)
-            lon = float(lon)
-            radius = float(radius)
-        except ValueError:
-            return None, Response({"error": "lat, lon and radius must be valid numbers"}, status=400)
+        if queryset is None:
+            queryset = self.queryset
+        if request.query_params.get('bbox') is not None:
+            return self.get_bbox_queryset(request, queryset)
+
+        circle, error = parse_circle_params(request.query_params, default_radius)
+        if error:
+            return None, Response({"error": error}, status=400)
+        lat, lon, radius = circle
 
-        if radius > 5 and (not request.user or not request.user.is_authenticated or 'admin' not in getattr(request.user, 'roles', [])):
+        if radius > MAX_PUBLIC_RADIUS_KM and not _is_admin(request):
             return None, Response({"error": "You can only search within a radius of 5 km unless you are an admin"}, status=403)
 
         center = Point(lon, lat, srid=4326)
-        queryset = self.queryset.annotate(distance=Distance('point', center)).filter(distance__lte=D(km=radius))
+        queryset = queryset.filter(point__dwithin=(center, D(km=radius)))
+        if with_distance:
+            queryset = queryset.annotate(distance=Distance('point', center))
         
         return queryset, None
 
+    def parse_bbox(self, request):
+        """
+        Parse and check the bbox=minLon,minLat,maxLon,maxLat parameter.
+        Non-admin users are limited to the area of a 5 km radius circle.
+
+        :param request: The HTTP request
+        :type request: HttpRequest
+        :return: tuple of ((min_lon, min_lat, max_lon, max_lat) or None, error_response_or_None)
+        :rtype: tuple
+        """
+        bbox, error = parse_bbox_params(request.query_params)
+        if error:
+            return None, Response({"error": error}, status=400)
+        min_lon, min_lat, max_lon, max_lat = bbox
+
+        if _bbox_area_km2(min_lon, min_lat, max_lon, max_lat) > MAX_PUBLIC_AREA_KM2 and not _is_admin(request):
+            return None, Response({"error": f"You can only search within an area of {MAX_PUBLIC_AREA_KM2:.1f} km² unless you are an admin"}, status=403)
+
+        return (min_lon, min_lat, max_lon, max_lat), None
+
+    def get_bbox_queryset(self, request, queryset):
+        """
+        Filter the queryset by the bounding box of the map viewport (bbox=minLon,minLat,maxLon,maxLat).
+        The filter uses the bounding box overlap operator (point && envelope), which is answered by the spatial index.
+
+        :param request: The HTTP request
+        :type request: HttpRequest
+        :param queryset: The queryset to filter
+        :type queryset: QuerySet
+        :return: tuple of (filtered_queryset, error_response_or_None)
+        :rtype: tuple
+        """
+        bbox, error_response = self.parse_bbox(request)
+        if error_response:
+            return None, error_response
+
+        envelope = Polygon.from_bbox(bbox)
+        envelope.srid = 4326
+        return queryset.filter(point__bboverlaps=envelope), None
+
+    def get_list_response(self, queryset, serializer_class=None):
+        """
+        Serialize a filtered queryset as a plain JSON array, a cursor-paginated page (`cursor` or `page_size` parameter),
+        a streamed JSON array (`stream=true` parameter), grid clusters for a zoom level (`cluster=<zoom>` parameter)
+        or the changes since a previous sync (`since` parameter, see get_sync_response).
+
+        :param queryset: The filtered queryset
+        :type queryset: QuerySet
+        :param serializer_class: The serializer class, defaults to the viewset serializer class
+        :type serializer_class: type
+        :return: The response
+        :rtype: Response or StreamingHttpResponse
+        """
+        if self.request.query_params.get('since') is not None:
+            return self.get_sync_response(queryset, serializer_class)
+
+        cluster = self.request.query_params.get('cluster')
+        if cluster is not None:
+            try:
+                zoom = int(cluster)
+            except ValueError:
+                return Response({"error": "Invalid cluster parameter, expected a zoom level"}, status=400)
+            if not 0 <= zoom <= MAX_CLUSTER_ZOOM:
+                return Response({"error": f"The cluster zoom level must be between 0 and {MAX_CLUSTER_ZOOM}"}, status=400)
+            return Response(cluster_queryset(queryset, zoom))
+
+        serializer_class = serializer_class or self.get_serializer_class()
+        context = self.get_serializer_context()
+        if self.request.query_params.get('stream', '').lower() in ('1', 'true'):
+            chunks = self._stream_json_array(queryset, serializer_class, context)
+            if settings.SERVER_MODE == 'asgi':
+                # Django buffers the whole body of a sync iterator under ASGI, an async iterator is streamed
+                chunks = _iterate_in_thread(chunks)
+            return StreamingHttpResponse(chunks, content_type='application/json')
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer_class(page, many=True, context=context).data)
+        return Response(serializer_class(queryset, many=True, context=context).data)
+
+    def get_sync_response(self, queryset, serializer_class=None):
+        """
+        Serialize the rows of a filtered queryset created or updated since the `since` parameter, with the ids
+        of the rows deleted since then in the same area (see hornet.sync). The response is
+        {"results": [...], "deleted": [ids], "next_since": cursor of the next sync}.
+
+        :param queryset: The filtered queryset
+        :type queryset: QuerySet
+        :param serializer_class: The serializer class, defaults to the viewset serializer class
+        :type serializer_class: type
+        :return: The response
+        :rtype: Response
+        """
+        since = parse_since(self.request.query_params['since'])
+        if since is None:
+            return Response({"error": "since must be an ISO 8601 datetime or a Unix timestamp"}, status=400)
+        if is_expired(since):
+            return Response({"error": f"since is older than {TOMBSTONE_RETENTION_DAYS} days, fetch the full list instead"}, status=410)
+
+        cursor = next_cursor()
+        tombstones = self.get_visible_tombstones(
+            Tombstone.objects.filter(model=queryset.model._meta.model_name, deleted_at__gte=since)
+        )
+        if self.request.query_params.get('bbox') is not None or self.request.query_params.get('lat'):
+            filtered_tombstones, error_response = self.get_geographic_queryset(self.request, queryset=tombstones)
+            if not error_response:
+                tombstones = filtered_tombstones
+
+        serializer_class = serializer_class or self.get_serializer_class()
+        rows = queryset.filter(updated_at__gte=since)
+        return Response({
+            'results': serializer_class(rows, many=True, context=self.get_serializer_context()).data,
+            'deleted': sorted(set(tombstones.values_list('object_id', flat=True))),
+            'next_since': cursor.isoformat(),
+        })
+
+    def get_visible_tombstones(self, tombstones):
+        """
+        Restrict the tombstones reported by the sync to the rows the user could see in the list.
+        All of them by default, viewsets with a restricted list override it with the same rules as their queryset.
+
+        :param tombstones: The tombstone queryset
+        :type tombstones: QuerySet
+        :return: The restricted queryset
+        :rtype: QuerySet
+        """
+        return tombstones
+
+    def get_cached_list_response(self, request, namespace, queryset=None, serializer_class=None, default_radius=5):
+        """
+        Same as get_geographic_queryset followed by get_list_response, through the tile-aligned response cache
+        (see hornet.geocache). The search area is snapped outwards on a grid, so the response may contain
+        a few rows just outside the requested area. The response carries an ETag and a Last-Modified header
+        and conditional requests are answered with 304 Not Modified.
+        Only anonymous requests within the public limits are cached; paginated, streamed and sync requests are not.
+
+        :param request: The HTTP request
+        :type request: HttpRequest
+        :param namespace: The cached endpoint family, invalidated by the changes of its rows ('hornets' or 'nests')
+        :type namespace: str
+        :param queryset: The queryset to filter, defaults to the viewset queryset
+        :type queryset: QuerySet
+        :param serializer_class: The serializer class, defaults to the viewset serializer class
+        :type serializer_class: type
+        :param default_radius: The default radius in km
+        :type default_radius: float
+        :return: The response
+        :rtype: Response or HttpResponse
+        """
+        if queryset is None:
+            queryset = self.queryset
+        filtered, error_response = self.get_geographic_queryset(request, default_radius, queryset)
+        if error_response:
+            return error_response
+        # Only the anonymous requests within the public limits are cached (admins may search much larger areas)
+        if request.user.is_authenticated or not is_public_cacheable(request.query_params, default_radius):
+            return self.get_list_response(filtered, serializer_class)
+
+        # The parameters were validated above, snap the search area
+        region, bbox = get_cache_region(request.query_params, self.action, default_radius)
+        if region[0] == 'bbox':
+            envelope = Polygon.from_bbox(bbox)
+            envelope.srid = 4326
+            filtered = queryset.filter(point__bboverlaps=envelope)
+        else:
+            _, lat, lon, radius = region[:4]
+            filtered = queryset.filter(point__dwithin=(Point(lon, lat, srid=4326), D(km=radius)))
+
+        def render():
+            response = self.get_list_response(filtered, serializer_class)
+            if response.status_code != 200:
+                return None
+            return JSONRenderer().render(response.data)
+
+        entry = get_or_render(namespace, region, bbox, render)
+        if entry is None:
+            return self.get_list_response(filtered, serializer_class)
+
+        return get_cached_entry_response(request, entry)
+
+    @staticmethod
+    def _stream_json_array(queryset, serializer_class, context):
+        """
+        Yield the queryset as a JSON array, fetching and serializing STREAM_CHUNK_SIZE rows at a time,
+        so the memory used by the worker does not depend on the number of rows.
+        """
+        renderer = JSONRenderer()
+        rows = queryset.iterator(chunk_size=STREAM_CHUNK_SIZE)
+        separator = b''
+        yield b'['
+        while chunk := list(islice(rows, STREAM_CHUNK_SIZE)):
+            data = serializer_class(chunk, many=True, context=context).data
+            yield separator + b','.join(renderer.render(item) for item in data)
+            separator = b','
+        yield b']'
+
+
+async def _iterate_in_thread(iterator):
+    """
+    Async iterator over a sync iterator reading the database. Every step runs in the same dedicated thread,
+    since the server-side cursor of QuerySet.iterator() belongs to the connection of the thread that opened it;
+    the thread closes the iterator and its connection at the end.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stream')
+    run = partial(sync_to_async, thread_sensitive=False, executor=executor)
+
+    def close():
+        iterator.close()
+        connection.close()
+
+    try:
+        while (chunk := await run(next)(iterator, None)) is not None:
+            yield chunk
+    finally:
+        await run(close)()
+        executor.shutdown(wait=False)
+
 
 def geographic_list_schema(default_radius=5):
     """Decorator to extend schema for geographic filtering in list actions.
@@ -60,65 +465,177 @@ def geographic_list_schema(default_radius=5):
     return extend_schema(
         parameters=[
             OpenApiParameter(name='lat', type=OpenApiTypes.FLOAT, location=OpenApiParameter.QUERY, 
-                           required=True),
+                           required=False, description="Required unless bbox is given"),
             OpenApiParameter(name='lon', type=OpenApiTypes.FLOAT, location=OpenApiParameter.QUERY, 
-                           required=True),
+                           required=False, description="Required unless bbox is given"),
             OpenApiParameter(name='radius', type=OpenApiTypes.FLOAT, location=OpenApiParameter.QUERY,  
                            required=False, default=default_radius),
+            OpenApiParameter(name='bbox', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                           required=False, description="Map viewport as minLon,minLat,maxLon,maxLat, used instead of lat/lon/radius"),
+            OpenApiParameter(name='cursor', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                           required=False, description="Cursor of the page to return, enables pagination"),
+            OpenApiParameter(name='page_size', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                           required=False, description="Number of results per page, enables pagination"),
+            OpenApiParameter(name='stream', type=OpenApiTypes.BOOL, location=OpenApiParameter.QUERY,
+                           required=False, description="Stream the results as a JSON array, without pagination"),
+            OpenApiParameter(name='cluster', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                           required=False, description="Zoom level (0-22): return grid clusters (count, centroid, breakdown) instead of the rows"),
+            OpenApiParameter(name='since', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                           required=False, description="next_since of a previous sync (or ISO 8601 datetime / Unix timestamp): return only the rows changed since then and the deleted ids"),
         ]
     )
 
 
 class HornetViewSet(GeographicFilterMixin, viewsets.ModelViewSet):
-    queryset = Hornet.objects.all()
+    queryset = Hornet.objects.select_related('created_by')
     serializer_class = HornetSerializer
+    pagination_class = GeographicCursorPagination
 
     @geographic_list_schema() # The permissions and authentication for this action are handled in the get_authenticators and get_permissions methods
     def list(self, request, *args, **kwargs):
-        queryset, error_response = self.get_geographic_queryset(request)
-        if error_response:
-            return error_response
-        
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.get_cached_list_response(request, 'hornets')
 
     @extend_schema(
         responses={200: HornetSerializer(many=True)},
     )
     @action(detail=False, methods=['get'])
     def my(self, request):
-        user_guid = getattr(request.user, 'guid', None)
-        user_obj = User.objects.filter(guid=user_guid).first()
-        queryset = Hornet.objects.filter(created_by=user_obj)
+        user_obj = getattr(request.user, 'local_user', None)
+        queryset = Hornet.objects.select_related('created_by').filter(created_by=user_obj)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @extend_schema(
+        request=HornetBulkItemSerializer(many=True),
+        responses={
+            201: OpenApiResponse(description="All the hornets were created: {created: [...], errors: []}"),
+            207: OpenApiResponse(description="Some hornets were created, errors gives the index and the errors of the others"),
+            400: OpenApiResponse(description="No hornet was created: {error: ...} for an invalid request, or {created: [], errors: [...]} when every item is invalid"),
+        },
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many hornets at once (e.g. the offline queue of a volunteer at a bait station).
+        Each item is validated on its own: the valid ones are inserted with a single bulk_create
+        and the errors of the others are returned with their index in the request.
+        """
+        if not isinstance(request.data, list):
+            return Response({"error": "Expected a JSON array of hornets"}, status=400)
+        if not request.data:
+            return Response({"error": "Expected at least one hornet"}, status=400)
+        if len(request.data) > MAX_BULK_HORNETS:
+            return Response({"error": f"At most {MAX_BULK_HORNETS} hornets can be created at once"}, status=400)
+
+        validator = HornetBulkItemSerializer(context=self.get_serializer_context())
+        user_obj = getattr(request.user, 'local_user', None)
+        hornets, errors = [], []
+        for index, item in enumerate(request.data):
+            try:
+                validated_data = validator.run_validation(item)
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+                continue
+            validated_data.update(created_by=user_obj, linked_nest=None)
+            hornet = Hornet(**validated_data)
+            # bulk_create bypasses GeolocatedModel.save(), so point and return_zone are computed here
+            hornet.update_geometries()
+            hornets.append(hornet)
+
+        if hornets:
+            Hornet.objects.bulk_create(hornets, batch_size=BULK_CREATE_BATCH_SIZE)
+            # bulk_create does not send post_save, invalidate the cached responses here
+            invalidate_points('hornets', ((hornet.latitude, hornet.longitude) for hornet in hornets))
+
+        created = HornetBulkItemSerializer(hornets, many=True, context=self.get_serializer_context()).data
+        if not hornets:
+            response_status = 400
+        elif errors:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = 201
+        return Response({'created': created, 'errors': errors}, status=response_status)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='bbox', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY, required=True,
+                           description="Region as minLon,minLat,maxLon,maxLat"),
+            OpenApiParameter(name='cell_size', type=OpenApiTypes.FLOAT, location=OpenApiParameter.QUERY, required=False,
+                           default=100, description="Size of the grid cells in meters (25 to 500)"),
+            OpenApiParameter(name='min_cones', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False,
+                           default=2, description="Minimum number of overlapping return cones"),
+            OpenApiParameter(name='limit', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False,
+                           default=20, description="Maximum number of hotspots (1 to 100)"),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(detail=False, methods=['get'])
+    def hotspots(self, request):
+        """
+        Rank the probable nest locations of a region by the number of hornet return cones overlapping there.
+        """
+        bbox, error_response = self.parse_bbox(request)
+        if error_response:
+            return error_response
+        try:
+            cell_size = float(request.query_params.get('cell_size', 100))
+            min_cones = int(request.query_params.get('min_cones', 2))
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({"error": "cell_size, min_cones and limit must be valid numbers"}, status=400)
+        if not (25 <= cell_size <= 500 and min_cones >= 2 and 1 <= limit <= 100):
+            return Response({"error": "cell_size must be between 25 and 500, min_cones at least 2 and limit between 1 and 100"}, status=400)
+
+        hotspots = find_nest_hotspots(bbox, cell_size_m=cell_size, min_cones=min_cones, limit=limit)
+        return Response(hotspots)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='full', type=OpenApiTypes.BOOL, location=OpenApiParameter.QUERY, required=False,
+                           description="Scan all the unlinked hornets instead of only the hornets created or updated since the last run"),
+        ],
+        request=None,
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(detail=False, methods=['post'], url_path='link-nests')
+    def link_nests(self, request):
+        """
+        Link the unlinked hornets to the nearest live nest inside their return cone.
+        """
+        run = link_hornets_to_nests(full=request.query_params.get('full', '').lower() in ('1', 'true'))
+        return Response({
+            'hornets_scanned': run.hornets_scanned,
+            'hornets_linked': run.hornets_linked,
+            'duration': run.duration,
+            'hornets_per_second': run.hornets_scanned / run.duration if run.duration else None,
+        })
+
     # No need permission to create a hornet, but only beekeepers and admins can list, and only admins can retrieve, update, partial_update and destroy them
     def get_authenticators(self): # This method is used here because we can not use the @authentication_classes decorator on the herited actions
         # list, create, retrieve, update, partial_update, destroy are the names of the actions that are automatically created by the ModelViewSet
         # Each action corresponds to a method in the viewset, e.g. list corresponds to the GET /hornets/ endpoint.
         # if hasattr(self, 'action') and self.action in ['list', 'retrieve', 'update', 'partial_update', 'destroy']:
         # Allow public access to list action (viewing hornets)
-        if hasattr(self, 'action') and self.action in ['retrieve', 'create', 'update', 'partial_update', 'destroy', 'my']:
+        if hasattr(self, 'action') and self.action in ['retrieve', 'create', 'bulk', 'update', 'partial_update', 'destroy', 'my', 'hotspots', 'link_nests']:
             return [JWTBearerAuthentication()]
         return super().get_authenticators()
 
     def get_permissions(self): # This method is used here because we can not use the @permission_classes decorator on the herited actions
         # Allow public access to list action (viewing hornets)
-        if hasattr(self, 'action') and self.action in ('create', 'my'):
+        if hasattr(self, 'action') and self.action in ('create', 'bulk', 'my', 'hotspots'):
             return [HasAnyRole(['volunteer', 'beekeeper', 'admin'])]
-        elif hasattr(self, 'action') and self.action in ['retrieve', 'update', 'partial_update', 'destroy']:
+        elif hasattr(self, 'action') and self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'link_nests']:
             return [HasAnyRole(['admin'])]
         return super().get_permissions()
     
     def perform_create(self, serializer):
-        user_guid = getattr(self.request.user, 'guid', None)
-        user_obj = User.objects.filter(guid=user_guid).first()
+        user_obj = getattr(self.request.user, 'local_user', None)
         serializer.save(created_by=user_obj, linked_nest=None)
 
 class NestViewSet(GeographicFilterMixin, viewsets.ModelViewSet):
-    queryset = Nest.objects.all()
+    queryset = Nest.objects.select_related('created_by')
     serializer_class = NestSerializer
+    pagination_class = GeographicCursorPagination
 
     @geographic_list_schema() # The permissions and authentication for this action are handled in the get_authenticators and get_permissions methods
     def list(self, request, *args, **kwargs):
@@ -126,22 +643,19 @@ class NestViewSet(GeographicFilterMixin, viewsets.ModelViewSet):
         if error_response:
             return error_response
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.get_list_response(queryset)
 
     @geographic_list_schema() # Public endpoint for destroyed nests only
     @action(detail=False, methods=['get'])
     def destroyed(self, request, *args, **kwargs):
-        queryset, error_response = self.get_geographic_queryset(request)
-        if error_response:
-            return error_response
-        
-        # Filter only destroyed nests
-        queryset = queryset.filter(destroyed=True)
-        
-        # Use public serializer to exclude sensitive information like created_by
-        serializer = PublicNestSerializer(queryset, many=True)
-        return Response(serializer.data)
+        # Filter only destroyed nests, and use public serializer to exclude sensitive information like created_by
+        return self.get_cached_list_response(request, 'nests', self.queryset.filter(destroyed=True), PublicNestSerializer)
+
+    def get_visible_tombstones(self, tombstones):
+        # The public endpoint only lists destroyed nests, the ids of deleted active nests must not leak
+        if getattr(self, 'action', None) == 'destroyed':
+            return tombstones.filter(destroyed=True)
+        return tombstones
 
     # Volunteers, beekeepers and admins can create and list nests, but only admins can retrieve, update, partial_update and destroy them
     def get_authenticators(self):
@@ -160,111 +674,68 @@ class NestViewSet(GeographicFilterMixin, viewsets.ModelViewSet):
         return [HasAnyRole(['admin'])]
     
     def perform_create(self, serializer):
-        user_guid = getattr(self.request.user, 'guid', None)
-        user_obj = User.objects.filter(guid=user_guid).first()
+        user_obj = getattr(self.request.user, 'local_user', None)
         serializer.save(created_by=user_obj)
 
 class ApiaryViewSet(GeographicFilterMixin, viewsets.ModelViewSet):
-    queryset = Apiary.objects.all()
+    queryset = with_group_permissions(Apiary.objects.select_related('created_by'))
     serializer_class = ApiarySerializer
+    pagination_class = GeographicCursorPagination
+
+    # Message of the PermissionDenied raised by each permission check of check_object_permissions
+    PERMISSION_DENIED_MESSAGES = {
+        'read': "You do not have permission to view this apiary.",
+        'update': "You do not have permission to update this apiary.",
+        'delete': "You do not have permission to delete this apiary.",
+    }
 
-    def _get_membership_paths(self, request):
-        """Extracts the list of group paths from the JWT token (scope 'membership')."""
-        token_info = getattr(request.user, 'token_info', None)
-        if not token_info:
-            return []
-        return token_info.get('membership', [])
+    @property
+    def permission_resolver(self):
+        """Apiary permissions of the user of the request, resolved once per request."""
+        if getattr(self, '_permission_resolver', None) is None:
+            self._permission_resolver = ApiaryPermissionResolver(self.request.user)
+        return self._permission_resolver
 
-    def _has_apiary_permission(self, request, apiary, perm_type):
+    def check_object_permissions(self, request, obj):
         """
-        Checks if the user has the required permission (read/update/delete) on the apiary.
-        perm_type: 'read', 'update', 'delete'
+        Check the apiary permission of the action (read/update/delete) on the object loaded by get_object,
+        so retrieve, update, partial_update and destroy load the apiary only once.
         """
-        user = request.user
-        debug_info = {
-            'user_guid': getattr(user, 'guid', None),
-            'user_roles': getattr(user, 'roles', []),
-            'perm_type': perm_type,
-            'apiary_id': apiary.id,
-        }
-        # Admin: always allowed
-        if 'admin' in getattr(user, 'roles', []):
-            print(f"[DEBUG] Admin access granted: {debug_info}")
-            return True
-        # Owner: always allowed
-        user_guid = getattr(user, 'guid', None)
-        if apiary.created_by and str(apiary.created_by.guid) == str(user_guid):
-            print(f"[DEBUG] Owner access granted: {debug_info}")
-            return True
-        # Group-based permissions
-        membership_paths = self._get_membership_paths(request)
-        debug_info['membership_paths'] = membership_paths
-        if not membership_paths:
-            print(f"[DEBUG] No membership, access denied: {debug_info}")
-            return False
-        # Find matching groups in DB
-        groups = BeekeeperGroup.objects.filter(path__in=membership_paths)
-        debug_info['matching_groups'] = list(groups.values_list('path', flat=True))
-        perms = ApiaryGroupPermission.objects.filter(apiary=apiary, group__in=groups)
-        debug_info['matching_perms'] = list(perms.values('group__path', 'can_read', 'can_update', 'can_delete'))
-        if perm_type == 'read':
-            allowed = perms.filter(can_read=True).exists()
-        elif perm_type == 'update':
-            allowed = perms.filter(can_update=True).exists()
-        elif perm_type == 'delete':
-            allowed = perms.filter(can_delete=True).exists()
-        else:
-            allowed = False
-        print(f"[DEBUG] Group-based access {'granted' if allowed else 'denied'}: {debug_info}")
-        return allowed
+        super().check_object_permissions(request, obj)
+        perm_type = ACTION_PERMISSIONS.get(self.action)
+        if perm_type is None:
+            return
+        allowed = self.permission_resolver.has_permission(obj, perm_type)
+        logger.debug(
+            "Apiary permission %s: request_id=%s user=%s apiary=%s perm=%s",
+            'granted' if allowed else 'denied', _request_id(request), getattr(request.user, 'guid', None), obj.id, perm_type,
+        )
+        if not allowed:
+            raise PermissionDenied(self.PERMISSION_DENIED_MESSAGES[perm_type])
 
     @geographic_list_schema() # The permissions and authentication for this action are handled in the get_authenticators and get_permissions methods
     def list(self, request, *args, **kwargs):
+        start = time.perf_counter()
         user = request.user
-        print(f"[DEBUG] USER: {request.user}")
-        print(f"[DEBUG] Apiary list requested by user: guid={getattr(user, 'guid', None)}, roles={getattr(user, 'roles', [])}")
-        # Admin: accès à tout
-        if 'admin' in getattr(user, 'roles', []):
-            queryset, error_response = self.get_geographic_queryset(request)
-            if error_response:
-                print(f"[DEBUG] Error in geo filter: {error_response.data}")
-                return error_response
-        else:
-            user_guid = getattr(user, 'guid', None)
-            membership_paths = self._get_membership_paths(request)
-            print(f"[DEBUG] membership_paths: {membership_paths}")
-            # Propriétaire
-            q_owner = Apiary.objects.filter(created_by__guid=user_guid)
-            # Groupes avec can_read
-            groups = BeekeeperGroup.objects.filter(path__in=membership_paths)
-            print(f"[DEBUG] matching_groups: {list(groups.values_list('path', flat=True))}")
-            apiary_ids = ApiaryGroupPermission.objects.filter(
-                group__in=groups, can_read=True
-            ).values_list('apiary_id', flat=True)
-            print(f"[DEBUG] apiary_ids with can_read: {list(apiary_ids)}")
-            q_group = Apiary.objects.filter(id__in=apiary_ids)
-            queryset = (q_owner | q_group).distinct()
-            # Appliquer le filtre géographique si demandé
-            center = None
-            lat = request.query_params.get('lat')
-            lon = request.query_params.get('lon')
-            radius = request.query_params.get('radius', 5)
-            if lat and lon:
-                try:
-                    lat = float(lat)
-                    lon = float(lon)
-                    radius = float(radius)
-                    from django.contrib.gis.geos import Point
-                    from django.contrib.gis.db.models.functions import Distance
-                    from django.contrib.gis.measure import D
-                    center = Point(lon, lat, srid=4326)
-                    queryset = queryset.annotate(distance=Distance('point', center)).filter(distance__lte=D(km=radius))
-                except Exception:
-                    print(f"[DEBUG] Invalid geo params: lat={lat}, lon={lon}, radius={radius}")
-                    return Response({"error": "lat, lon and radius must be valid numbers"}, status=400)
-        print(f"[DEBUG] Apiary list count: {queryset.count()}")
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        is_admin = 'admin' in getattr(user, 'roles', [])
+        # Admin: accès à tout ; sinon ses propres ruchers et ceux lisibles par un de ses groupes
+        queryset, error_response = self.get_geographic_queryset(request, queryset=readable_apiaries(self.queryset, user))
+        if error_response:
+            logger.debug("Apiary list rejected: request_id=%s user=%s error=%s", _request_id(request), getattr(user, 'guid', None), error_response.data)
+            return error_response
+
+        response = self.get_list_response(queryset)
+        # The row count is only known without a query for the plain JSON array responses
+        logger.debug(
+            "Apiary list: request_id=%s user=%s admin=%s rows=%s duration_ms=%.1f",
+            _request_id(request), getattr(user, 'guid', None), is_admin,
+            len(response.data) if isinstance(getattr(response, 'data', None), list) else '-',
+            (time.perf_counter() - start) * 1000,
+        )
+        return response
+
+    def get_visible_tombstones(self, tombstones):
+        return readable_tombstones(tombstones, self.request.user)
 
     def get_authenticators(self):
         return [JWTBearerAuthentication()]
@@ -280,30 +751,54 @@ class ApiaryViewSet(GeographicFilterMixin, viewsets.ModelViewSet):
         return [HasAnyRole(['admin'])]
 
     def perform_create(self, serializer):
-        user_guid = getattr(self.request.user, 'guid', None)
-        user_obj = User.objects.filter(guid=user_guid).first()
+        user_obj = getattr(self.request.user, 'local_user', None)
         serializer.save(created_by=user_obj)
 
-    def retrieve(self, request, *args, **kwargs):
-        apiary = self.get_object()
-        if not self._has_apiary_permission(request, apiary, 'read'):
-            raise PermissionDenied("You do not have permission to view this apiary.")
-        return super().retrieve(request, *args, **kwargs)
-
-    def update(self, request, *args, **kwargs):
-        apiary = self.get_object()
-        if not self._has_apiary_permission(request, apiary, 'update'):
-            raise PermissionDenied("You do not have permission to update this apiary.")
-        return super().update(request, *args, **kwargs)
-
-    def partial_update(self, request, *args, **kwargs):
-        apiary = self.get_object()
-        if not self._has_apiary_permission(request, apiary, 'update'):
-            raise PermissionDenied("You do not have permission to update this apiary.")
-        return super().partial_update(request, *args, **kwargs)
-
-    def destroy(self, request, *args, **kwargs):
-        apiary = self.get_object()
-        if not self._has_apiary_permission(request, apiary, 'delete'):
-            raise PermissionDenied("You do not have permission to delete this apiary.")
-        return super().destroy(request, *args, **kwargs)
+
+class VectorTileView(APIView):
+    """
+    Vector tiles (MVT) of the hornets, nests and apiaries: GET /api/tiles/{layer}/{z}/{x}/{y}.mvt
+    The access rules of the list endpoints apply: everyone sees the hornets, the public only sees the destroyed nests,
+    and apiaries are restricted to beekeepers and admins, with the group permissions.
+    Non-admin users are limited to tiles smaller than the area of a 5 km radius circle.
+    """
+    authentication_classes = [JWTBearerAuthentication]  # Requests without Authorization header stay anonymous
+    permission_classes = []
+    MAX_ZOOM = 22
+
+    @extend_schema(responses={(200, 'application/vnd.mapbox-vector-tile'): OpenApiTypes.BINARY})
+    def get(self, request, layer, z, x, y):
+        if layer not in LAYER_ATTRIBUTES:
+            raise NotFound(f"Unknown layer '{layer}', expected one of {list(LAYER_ATTRIBUTES)}.")
+        if not (0 <= z <= self.MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValidationError("Invalid tile coordinates.")
+        if _bbox_area_km2(*tile_bounds(z, x, y)) > MAX_PUBLIC_AREA_KM2 and not _is_admin(request):
+            raise PermissionDenied("You can only request tiles of this zoom level if you are an admin.")
+
+        tile = render_tile(layer, self.get_layer_queryset(request, layer), z, x, y)
+
+        response = HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
+        # Low zoom tiles aggregate many rows and change less often per pixel, they are cached longer
+        max_age = 60 if z >= 14 else 300
+        if request.user and request.user.is_authenticated:
+            patch_cache_control(response, private=True, max_age=max_age)
+        else:
+            patch_cache_control(response, public=True, max_age=max_age)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def get_layer_queryset(self, request, layer):
+        user = request.user
+        roles = getattr(user, 'roles', []) if user and user.is_authenticated else []
+        if layer == 'hornets':
+            return Hornet.objects.all()
+        if layer == 'nests':
+            if any(role in roles for role in ['volunteer', 'beekeeper', 'admin']):
+                return Nest.objects.all()
+            return Nest.objects.filter(destroyed=True)
+        # apiaries
+        if not user or not user.is_authenticated:
+            raise NotAuthenticated()
+        if not any(role in roles for role in ['beekeeper', 'admin']):
+            raise PermissionDenied()
+        return readable_apiaries(Apiary.objects.all(), user)
@@ -7,10 +7,24 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hornet_finder_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from hornet_finder_api.utils import server_event_loop  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Lets the sync views run their concurrent Keycloak lookups on the event loop (see get_user_profiles)
+    server_event_loop.set(asyncio.get_running_loop())
+    await django_application(scope, receive, send)
+
+# Load the realm signing keys when the worker starts, instead of during the first authenticated request
+from hornet_finder_api.authentication import JWTBearerAuthentication  # noqa: E402
+
+JWTBearerAuthentication.jwks.warm_up()
@@ -1,11 +1,14 @@
 import jwt
+import hashlib
 from typing import Tuple, Optional
 from django.http.request import HttpRequest
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import BasePermission
 from drf_spectacular.extensions import OpenApiAuthenticationExtension
-from hornet_finder_api.utils import get_realm_public_key, get_user_display_name
+from django.utils import timezone
+from jwt.algorithms import RSAAlgorithm
+from hornet_finder_api.utils import TTLCache, get_realm_certs, get_user_display_name, get_profile_from_claims, register_stats
 import requests
 import os
 import threading
@@ -16,18 +19,26 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of verified tokens kept per worker process (each entry lives until the token expires)
+VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv("VERIFIED_TOKEN_CACHE_SIZE", "2048"))
+# Local users known to exist are remembered for this many seconds, so authentication does not query them again
+KNOWN_USER_CACHE_TTL = int(os.getenv("KNOWN_USER_CACHE_TTL", "300"))
+KNOWN_USER_CACHE_SIZE = int(os.getenv("KNOWN_USER_CACHE_SIZE", "4096"))
+
 
 class JWTUser:
     """
     Represents a user authenticated via JWT token.
     This class is used to create a user object from the token information.
     It extracts the guid and roles from the token info.
+    The matching local User, resolved during authentication, is available as `local_user`.
     """
 
-    def __init__(self, token_info):
+    def __init__(self, token_info, local_user: Optional[User] = None):
         self.token_info = token_info
         self.guid = token_info.get('sub')
         self.roles = token_info.get('realm_access', {}).get('roles', [])
+        self.local_user = local_user
 
     @property
     def is_authenticated(self):
@@ -52,12 +63,95 @@ class HasAnyRole(BasePermission):
         user_roles = getattr(user, 'roles', [])
         return any(role in user_roles for role in self.required_roles)
 
+class JWKSCache:
+    """
+    Process-wide cache of the realm signing keys, keyed by their `kid`.
+    Keys are stored as parsed RSAPublicKey objects, so they are not re-parsed for every token.
+    The key set is fetched again when a token is signed with an unknown `kid` (key rotation).
+    Only one thread refetches at a time, and refetches are rate limited to protect Keycloak
+    from tokens carrying random `kid` values.
+    """
+
+    def __init__(self, fetch_jwks, min_refresh_interval: float = 10):
+        self._fetch_jwks = fetch_jwks
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._last_refresh = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """
+        Fetch the key set from Keycloak and replace the cached keys.
+        """
+        keys = {}
+        for jwk in self._fetch_jwks().get('keys', []):
+            if jwk.get('kty') != 'RSA' or jwk.get('use', 'sig') != 'sig':
+                continue
+            keys[jwk.get('kid')] = RSAAlgorithm.from_jwk(jwk)
+        self._keys = keys
+        self._last_refresh = time.monotonic()
+        self.refreshes += 1
+        logger.debug(f"Loaded {len(keys)} realm signing key(s): {list(keys)}")
+
+    def stats(self) -> dict:
+        """
+        Return the number of cached keys and of key set fetches.
+
+        :rtype: dict
+        """
+        return {'keys': len(self._keys), 'refreshes': self.refreshes}
+
+    def warm_up(self) -> None:
+        """
+        Fetch the key set if it was never fetched. Failures are logged, the keys will then be fetched on first use.
+        """
+        if self._last_refresh is not None:
+            return
+        try:
+            with self._lock:
+                if self._last_refresh is None:
+                    self.refresh()
+        except Exception as e:
+            logger.warning(f"Could not pre-load the realm signing keys: {type(e).__name__}: {e}")
+
+    def get_signing_key(self, token: str):
+        """
+        Return the public key matching the `kid` of the token header.
+
+        :param token: The encoded JWT token
+        :type token: str
+        :return: The public key to verify the token signature
+        :rtype: RSAPublicKey
+        :raises jwt.InvalidTokenError: If no realm key matches the token
+        """
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        with self._lock:
+            key = self._keys.get(kid)  # Another thread may have refreshed the keys while we were waiting
+            if key is None:
+                elapsed = None if self._last_refresh is None else time.monotonic() - self._last_refresh
+                if elapsed is None or elapsed >= self.min_refresh_interval:
+                    self.refresh()
+                    key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"No realm signing key matches kid '{kid}'")
+        return key
+
+
 class JWTBearerAuthentication(BaseAuthentication):
     """
     Custom authentication class that uses JWT tokens for user authentication.
     """
 
-    KEYCLOAK_PUBLIC_KEY = None
+    jwks = JWKSCache(get_realm_certs)  # Shared by all the instances of the worker process
+    # Claims of the tokens already verified, keyed by the SHA-256 digest of the token, until their expiration
+    verified_tokens = TTLCache(maxsize=VERIFIED_TOKEN_CACHE_SIZE, ttl=0, name='verified_tokens')
+    # Local users known to exist with an up-to-date profile, keyed by GUID
+    known_users = TTLCache(maxsize=KNOWN_USER_CACHE_SIZE, ttl=KNOWN_USER_CACHE_TTL, name='known_users')
 
     def authenticate(self, request: HttpRequest) -> Optional[Tuple[JWTUser, dict]]:
         """
@@ -77,31 +171,72 @@ class JWTBearerAuthentication(BaseAuthentication):
         logger.debug(f"Found Authorization header: {token[:50]}..." if len(token) > 50 else f"Found Authorization header: {token}")
         
         try:
-            if not self.KEYCLOAK_PUBLIC_KEY:  # If the public key is not set, retrieve it
-                logger.debug("Retrieving Keycloak public key...")
-                self.KEYCLOAK_PUBLIC_KEY = get_realm_public_key()  # Get the public key of the Keycloak realm
-                logger.debug("Successfully retrieved Keycloak public key")
-                
-            token_info = jwt.decode(token.split()[1], self.KEYCLOAK_PUBLIC_KEY, algorithms=['RS256'], audience='account') # Decode the token using the public key
-            logger.debug(f"Successfully decoded JWT token for user: {token_info.get('preferred_username', 'unknown')}")
-            
-            user = JWTUser(token_info)  # Create a JWTUser object with the token info
+            raw_token = token.split()[1]
+            digest = hashlib.sha256(raw_token.encode()).hexdigest()
+            token_info = self.verified_tokens.get(digest)
+            verified = token_info is not TTLCache.MISSING  # Already verified by this worker
+            if not verified:
+                signing_key = self.jwks.get_signing_key(raw_token)  # Get the cached public key of the Keycloak realm
+                token_info = jwt.decode(raw_token, signing_key, algorithms=['RS256'], audience='account') # Decode the token using the public key
+                logger.debug(f"Successfully decoded JWT token for user: {token_info.get('preferred_username', 'unknown')}")
 
             # --- On-the-fly creation of the local user if not existing ---
             guid = token_info.get('sub')
-            if guid:
-                try:
-                    User.objects.get(guid=guid)
-                except User.DoesNotExist:
-                    logger.debug(f"Creating new user with GUID: {guid}")
-                    User.objects.create(guid=uuid.UUID(guid))
+            local_user = self._sync_local_user(guid, token_info) if guid else None
             # ---------------------------------------------------------------
 
+            if not verified and 'exp' in token_info:
+                self.verified_tokens.set(digest, token_info, ttl=token_info['exp'] - time.time())
+
+            user = JWTUser(token_info, local_user)  # Create a JWTUser object with the token info
             return (user, token_info)
         except Exception as e:
             logger.error(f"JWT authentication failed: {type(e).__name__}: {e}")
             raise AuthenticationFailed("Invalid token. " + str(e)) # If the decoding of the token fails, raise an exception, indicating that the token is invalid
-    
+
+    def _sync_local_user(self, guid: str, token_info: dict) -> User:
+        """
+        Return the local user, creating it if it does not exist yet, and refresh its denormalized profile
+        from the token claims when it changed.
+        Users already seen by this worker are served from the known_users cache without any query,
+        until KNOWN_USER_CACHE_TTL seconds after they were read.
+
+        :param guid: The Keycloak user GUID (the 'sub' claim)
+        :type guid: str
+        :param token_info: The decoded JWT token
+        :type token_info: dict
+        :return: The local user
+        :rtype: User
+        """
+        profile = get_profile_from_claims(token_info)
+        user_obj = self.known_users.get(guid)
+        cached = user_obj is not TTLCache.MISSING
+        if not cached:
+            # Atomic upsert: concurrent first requests of the same user do not fail on the primary key
+            user_obj, created = User.objects.get_or_create(
+                guid=uuid.UUID(guid),
+                defaults={'profile_synced_at': timezone.now(), **profile},
+            )
+            if created:
+                logger.debug(f"Created new user with GUID: {guid}")
+
+        if (user_obj.profile_synced_at is None
+                or user_obj.username != profile['username']
+                or user_obj.display_name != profile['display_name']):
+            logger.debug(f"Refreshing profile of user with GUID: {guid}")
+            synced_at = timezone.now()
+            User.objects.filter(guid=guid).update(profile_synced_at=synced_at, **profile)
+            user_obj = User(guid=user_obj.guid, date_created=user_obj.date_created, profile_synced_at=synced_at, **profile)
+            cached = False
+
+        # Only stored after a query or an update, so that an entry expires KNOWN_USER_CACHE_TTL seconds after
+        # the user was read from the database, however often the user sends requests
+        if not cached:
+            self.known_users.set(guid, user_obj)
+        return user_obj
+
+
+register_stats('jwks', JWTBearerAuthentication.jwks.stats)
 
 
 class JWTScheme(OpenApiAuthenticationExtension):
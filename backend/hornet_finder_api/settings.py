@@ -121,11 +121,23 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'hornet_finder_api.wsgi.application'
+ASGI_APPLICATION = 'hornet_finder_api.asgi.application'
+
+# 'asgi' when served by uvicorn workers (see docker-entrypoint.sh): the public map endpoints then get async entry points
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Database connections (see the "Database connections" section of the README):
+# - by default, each worker thread keeps its connection for DB_CONN_MAX_AGE seconds, checked before reuse
+# - DB_POOL=True uses a psycopg connection pool per worker process instead (required for reuse in ASGI mode,
+#   where Django closes the persistent connections at the end of each request)
+# - DB_PGBOUNCER=True when DB_HOST is a PgBouncer in transaction pooling mode
+DB_POOL = os.environ.get('DB_POOL', 'False').lower() == 'true'
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'False').lower() == 'true'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.contrib.gis.db.backends.postgis',
@@ -134,9 +146,55 @@ DATABASES = {
         'USER': os.environ.get('DB_USER'),
         'PORT': 5432,
         'PASSWORD': os.environ.get('DB_PASSWORD'),
+        # The pool manages the lifetime of its connections, persistent connections must then be disabled
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
 
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+        # One connection per gunicorn thread is enough
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    }
+
+if DB_PGBOUNCER:
+    # In transaction pooling mode, consecutive transactions may run on different server connections:
+    # the server-side cursors of QuerySet.iterator() (streamed lists) would not be found.
+    # Prepared statements are already disabled by Django (psycopg prepare_threshold=None).
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+
+# Cache (geographic response cache of the public endpoints, see hornet/geocache.py)
+# The local-memory cache is per process: with several workers, use Redis (REDIS_URL) or a shared directory (CACHE_DIR)
+# so that every worker sees the invalidations.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+elif os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR'),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,16 +1,153 @@
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from asgiref.sync import sync_to_async
 from keycloak import KeycloakOpenID, KeycloakAdmin
-from typing import Optional
+from keycloak.exceptions import KeycloakGetError
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Display names are cached per worker process for this many seconds
+DISPLAY_NAME_CACHE_TTL = int(os.getenv("DISPLAY_NAME_CACHE_TTL", "300"))
+# Maximum number of display names kept in the per-process cache
+DISPLAY_NAME_CACHE_SIZE = int(os.getenv("DISPLAY_NAME_CACHE_SIZE", "4096"))
+# GUIDs unknown to Keycloak are remembered for this many seconds, so repeated invalid payloads do not reach Keycloak
+UNKNOWN_USER_CACHE_TTL = int(os.getenv("UNKNOWN_USER_CACHE_TTL", "60"))
+# The workers log the counters of their caches every this many seconds (0 disables it), see log_process_stats
+STATS_LOG_INTERVAL = int(os.getenv("STATS_LOG_INTERVAL", "300"))
+# Maximum number of keep-alive HTTP connections kept by each pooled Keycloak client (one per gunicorn thread is enough)
+KEYCLOAK_POOL_MAXSIZE = int(os.getenv("KEYCLOAK_POOL_MAXSIZE", "10"))
+
 
 class KeycloakConfigurationError(Exception):
     """Raised when Keycloak configuration is missing or invalid."""
     pass
 
 
+# Counters of the per-process caches, by name, logged by log_process_stats
+_stats_sources: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+
+def register_stats(name: str, source: Callable[[], Dict[str, int]]) -> None:
+    """
+    Register a callable returning counters (e.g. the stats method of a cache), to be logged by log_process_stats.
+
+    :param name: The name of the counters in the logs.
+    :param source: A callable returning a dict of counters.
+    """
+    _stats_sources[name] = source
+
+
+def get_process_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Return the counters of all the registered caches of this worker process.
+
+    :rtype: Dict[str, Dict[str, int]]
+    """
+    return {name: source() for name, source in _stats_sources.items()}
+
+
+def log_process_stats() -> None:
+    """
+    Log the counters of all the registered caches of this worker process on one line, with the hit ratio of the caches.
+    """
+    parts = []
+    for name, stats in get_process_stats().items():
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        ratio = f" ratio={stats['hits'] / lookups:.2f}" if 'hits' in stats and lookups else ''
+        parts.append(f"{name}[" + ' '.join(f"{key}={value}" for key, value in stats.items()) + ratio + "]")
+    logger.info(f"Cache stats of worker {os.getpid()}: " + ' '.join(parts))
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire after a time to live.
+    It is meant to be instantiated at module level, so that it is shared by all the requests handled by a worker process.
+    A named cache registers its counters, which are then logged by log_process_stats.
+    """
+
+    MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        if name:
+            register_stats(name, self.stats)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Return the cached value for the key, or the default if the key is unknown or expired.
+
+        :param key: The cache key.
+        :param default: The value returned on a miss (TTLCache.MISSING by default).
+        :return: The cached value or the default.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value, evicting the least recently used entries if the cache is full.
+
+        :param key: The cache key.
+        :param value: The value to store (None is a valid value).
+        :param ttl: The time to live of this entry in seconds, defaults to the TTL of the cache.
+        """
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the hit and miss counters and the current size of the cache.
+
+        :rtype: Dict[str, int]
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Event loop of the ASGI server, set by hornet_finder_api.asgi for each request (None under WSGI and in commands).
+# The context is copied to the threads running the sync views, which can then run Keycloak lookups on the loop.
+server_event_loop: ContextVar[Optional[asyncio.AbstractEventLoop]] = ContextVar('server_event_loop', default=None)
+
+_display_name_cache = TTLCache(maxsize=DISPLAY_NAME_CACHE_SIZE, ttl=DISPLAY_NAME_CACHE_TTL, name='display_names')
+_unknown_user_cache = TTLCache(maxsize=DISPLAY_NAME_CACHE_SIZE, ttl=UNKNOWN_USER_CACHE_TTL, name='unknown_users')
+
+
 def _get_required_env_var(var_name: str) -> str:
     """
     Get a required environment variable or raise a configuration error.
@@ -28,53 +165,121 @@ def _get_required_env_var(var_name: str) -> str:
     return value
 
 
+# Registry of the Keycloak clients shared by all the threads of a worker process
+_keycloak_clients: Dict[str, Any] = {}
+_keycloak_clients_lock = threading.Lock()
+_keycloak_admin_token_lock = threading.Lock()
+_keycloak_pool_stats = {'hits': 0, 'misses': 0, 'token_refreshes': 0}
+
+
+def _get_pooled_client(name: str, factory):
+    """
+    Return the client registered under the given name, creating it with the factory on first use.
+
+    :param name: The name of the client in the registry.
+    :param factory: A callable building the client.
+    :return: The shared client.
+    """
+    with _keycloak_clients_lock:
+        client = _keycloak_clients.get(name)
+        if client is not None:
+            _keycloak_pool_stats['hits'] += 1
+            return client
+        _keycloak_pool_stats['misses'] += 1
+        client = factory()
+        _keycloak_clients[name] = client
+        return client
+
+
+def get_keycloak_pool_stats() -> Dict[str, int]:
+    """
+    Return the counters of the Keycloak client registry (hits, misses and admin token refreshes) for this process.
+
+    :rtype: Dict[str, int]
+    """
+    with _keycloak_clients_lock:
+        return dict(_keycloak_pool_stats)
+
+
+register_stats('keycloak_pool', get_keycloak_pool_stats)
+
+
+def reset_keycloak_clients() -> None:
+    """
+    Drop the pooled Keycloak clients, e.g. after a configuration change. They are rebuilt on next use.
+    """
+    with _keycloak_clients_lock:
+        _keycloak_clients.clear()
+
+
 def _get_keycloak_client():
     """
-    Returns a Keycloak client configured for the hornet-finder realm.
+    Returns the shared Keycloak client configured for the hornet-finder realm.
+    The client is created once per process and keeps its HTTP connections alive.
 
     :return: A KeycloakOpenID instance for authentication and token management.
     :rtype: KeycloakOpenID
     :raises KeycloakConfigurationError: If required configuration is missing.
     """
-    return KeycloakOpenID(
+    return _get_pooled_client('openid', lambda: KeycloakOpenID(
         server_url=_get_required_env_var("KC_INTERNAL_URL"),
         client_id=_get_required_env_var("KC_CLIENT_ID"),
         realm_name=_get_required_env_var("KC_REALM"),
-        client_secret_key=_get_required_env_var("KC_CLIENT_SECRET")
-    )
+        client_secret_key=_get_required_env_var("KC_CLIENT_SECRET"),
+        pool_maxsize=KEYCLOAK_POOL_MAXSIZE,
+    ))
 
 def _get_keycloak_admin():
     """
-    Returns a Keycloak admin client configured for the hornet-finder realm.
+    Returns the shared Keycloak admin client configured for the hornet-finder realm.
+    The client is created once per process, keeps its HTTP connections alive and reuses its service-account token,
+    which is renewed before it expires.
 
     :return: A KeycloakAdmin instance for managing users and roles.
     :rtype: KeycloakAdmin
     :raises KeycloakConfigurationError: If required configuration is missing.
     """
-    return KeycloakAdmin(
+    keycloak_admin = _get_pooled_client('admin', lambda: KeycloakAdmin(
         server_url=_get_required_env_var("KC_INTERNAL_URL"),
         realm_name=_get_required_env_var("KC_REALM"),
         client_id=_get_required_env_var("KC_CLIENT_ID"),
-        client_secret_key=_get_required_env_var("KC_CLIENT_SECRET")
-    )
+        client_secret_key=_get_required_env_var("KC_CLIENT_SECRET"),
+        pool_maxsize=KEYCLOAK_POOL_MAXSIZE,
+    ))
+    _refresh_admin_token_if_required(keycloak_admin)
+    return keycloak_admin
 
-def get_realm_public_key():
+def _admin_token_expired(keycloak_admin) -> bool:
+    connection = keycloak_admin.connection
+    return connection.token is None or connection.expires_at is None or datetime.now(tz=timezone.utc) >= connection.expires_at
+
+def _refresh_admin_token_if_required(keycloak_admin) -> None:
     """
-    Returns the public key of the hornet-finder realm.
-    
-    :return: The public key of the realm.
-    :rtype: str
+    Renew the service-account token of the shared admin client when it reaches the end of its lifetime
+    (python-keycloak renews it at 90% of its lifetime). The renewal is done by a single thread,
+    the other threads keep using the client once the new token is set.
+
+    :param keycloak_admin: The shared admin client.
+    :type keycloak_admin: KeycloakAdmin
+    """
+    if not _admin_token_expired(keycloak_admin):
+        return
+    with _keycloak_admin_token_lock:
+        if _admin_token_expired(keycloak_admin):  # Another thread may have renewed it while we were waiting
+            keycloak_admin.connection.get_token()
+            _keycloak_pool_stats['token_refreshes'] += 1
+
+def get_realm_certs() -> dict:
+    """
+    Returns the JSON Web Key Set (JWKS) of the hornet-finder realm, i.e. the public keys used to sign the tokens.
+
+    :return: The JWKS, as a dict with a 'keys' list.
+    :rtype: dict
     """
     try:
-        logger.debug("Creating Keycloak client to retrieve public key...")
-        keycloak_openid = _get_keycloak_client()
-        logger.debug("Successfully created Keycloak client, calling public_key()...")
-        public_key = keycloak_openid.public_key()
-        logger.debug(f"Successfully retrieved public key: {public_key[:50]}...")
-        pem_public_key = "-----BEGIN PUBLIC KEY-----\n" + public_key + "\n-----END PUBLIC KEY-----"
-        return pem_public_key
+        return _get_keycloak_client().certs()
     except Exception as e:
-        logger.error(f"Failed to retrieve Keycloak public key: {type(e).__name__}: {e}")
+        logger.error(f"Failed to retrieve Keycloak realm certs: {type(e).__name__}: {e}")
         raise
 
 def user_exists(guid: str) -> bool:
@@ -84,33 +289,214 @@ def user_exists(guid: str) -> bool:
     :param guid: The Keycloak user GUID to check.
     :type guid: str
 
+    Users reported as not found by Keycloak are remembered for UNKNOWN_USER_CACHE_TTL seconds.
+
     :return: True if the user exists, False otherwise.
     :rtype: bool
     """
+    guid = str(guid)
+    if _unknown_user_cache.get(guid, False):
+        return False
     keycloak_admin = _get_keycloak_admin()
     try:
         user = keycloak_admin.get_user(guid)
         return user is not None
-    except Exception:
+    except Exception as e:
+        if getattr(e, 'response_code', None) == 404:
+            _unknown_user_cache.set(guid, True)
         return False
 
+def _format_display_name(user: dict) -> Optional[str]:
+    """
+    Build a display name from a Keycloak user representation.
+
+    :param user: The Keycloak user representation.
+    :type user: dict
+    :return: The first and last name, or the username/email/id if not available.
+    :rtype: Optional[str]
+    """
+    first = user.get('firstName', '')
+    last = user.get('lastName', '')
+    if first or last:
+        return f"{first} {last}".strip()
+    return user.get('username') or user.get('preferred_username') or user.get('email') or user.get('id')
+
+
 def get_user_display_name(guid: str) -> Optional[str]:
     """
     Retrieve the user's display name (first and last name), or preferred_username/email/id if not available,
     for a given Keycloak user GUID.
+    Results (including unknown users) are cached per process, see DISPLAY_NAME_CACHE_TTL.
 
     :param guid: The Keycloak user ID.
     :type guid: str
     :return: The user's display name, or an alternative identifier, or None if not found.
     :rtype: Optional[str]
     """
+    return get_user_display_names([guid]).get(str(guid))
+
+
+def get_profile_from_claims(token_info: dict) -> Dict[str, str]:
+    """
+    Build the user profile (username and display name) from the claims of a Keycloak JWT token.
+
+    :param token_info: The decoded JWT token.
+    :type token_info: dict
+    :return: A dict with the 'username' and 'display_name' keys.
+    :rtype: Dict[str, str]
+    """
+    return {
+        'username': token_info.get('preferred_username') or '',
+        'display_name': _format_display_name({
+            'firstName': token_info.get('given_name', ''),
+            'lastName': token_info.get('family_name', ''),
+            'username': token_info.get('preferred_username'),
+            'email': token_info.get('email'),
+            'id': token_info.get('sub'),
+        }) or '',
+    }
+
+
+def _profiles_from_users(wanted, users) -> Dict[str, Optional[Dict[str, str]]]:
+    profiles: Dict[str, Optional[Dict[str, str]]] = dict.fromkeys(wanted)
+    for user in users:
+        profiles[user['id']] = {
+            'username': user.get('username') or '',
+            'display_name': _format_display_name(user) or '',
+        }
+    return profiles
+
+
+def _is_not_found(error: BaseException) -> bool:
+    """Whether a Keycloak error reports an unknown user (404), as opposed to Keycloak being unavailable."""
+    return isinstance(error, KeycloakGetError) and getattr(error, 'response_code', None) == 404
+
+
+def _running_on(loop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:  # No loop running in this thread
+        return False
+
+
+def get_user_profiles(guids: Iterable[str]) -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Retrieve the profiles (username and display name) of several Keycloak users with a single admin client.
+    Each user is requested by its GUID, at most KEYCLOAK_POOL_MAXSIZE at a time, so the cost stays proportional
+    to the number of GUIDs whatever the size of the realm.
+    In ASGI mode, the requests are sent concurrently on the event loop of the server (see a_get_user_profiles).
+    This function does not use any cache.
+
+    :param guids: The Keycloak user IDs (duplicates are ignored).
+    :type guids: Iterable[str]
+    :return: A mapping from each GUID to its profile, or None if the user was not found.
+    :rtype: Dict[str, Optional[Dict[str, str]]]
+    :raises Exception: If Keycloak cannot be reached.
+    """
+    wanted = {str(guid) for guid in guids}
+    if not wanted:
+        return dict.fromkeys(wanted)
+    loop = server_event_loop.get()
+    if len(wanted) > 1 and loop is not None and not loop.is_closed() and not _running_on(loop):
+        # Sync code of an ASGI request, running in a worker thread: the async Keycloak client is bound to the event loop
+        # of the server, so the lookups are run there while this thread waits
+        return asyncio.run_coroutine_threadsafe(a_get_user_profiles(wanted), loop).result()
+
     keycloak_admin = _get_keycloak_admin()
+
+    def fetch(guid):
+        try:
+            return keycloak_admin.get_user(guid)
+        except KeycloakGetError as e:
+            if _is_not_found(e):
+                return None  # Unknown user, its profile stays None
+            raise
+
+    if len(wanted) == 1:
+        users = [fetch(guid) for guid in wanted]
+    else:
+        # The pooled client keeps up to KEYCLOAK_POOL_MAXSIZE connections alive, one per concurrent lookup
+        with ThreadPoolExecutor(max_workers=min(KEYCLOAK_POOL_MAXSIZE, len(wanted))) as executor:
+            users = list(executor.map(fetch, wanted))
+    return _profiles_from_users(wanted, [user for user in users if user])
+
+
+async def a_get_user_profiles(guids: Iterable[str]) -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Async version of get_user_profiles: the users are requested concurrently with asyncio.gather,
+    at most KEYCLOAK_POOL_MAXSIZE at a time. Must run on the event loop of the ASGI server (see server_event_loop).
+    This function does not use any cache.
+
+    :param guids: The Keycloak user IDs (duplicates are ignored).
+    :type guids: Iterable[str]
+    :return: A mapping from each GUID to its profile, or None if the user was not found.
+    :rtype: Dict[str, Optional[Dict[str, str]]]
+    :raises Exception: If Keycloak cannot be reached.
+    """
+    wanted = {str(guid) for guid in guids}
+    if not wanted:
+        return dict.fromkeys(wanted)
+
+    # Creating the client and renewing its token are blocking calls, done once in a worker thread
+    keycloak_admin = await sync_to_async(_get_keycloak_admin, thread_sensitive=False)()
+    semaphore = asyncio.Semaphore(KEYCLOAK_POOL_MAXSIZE)
+
+    async def fetch(guid):
+        async with semaphore:
+            return await keycloak_admin.a_get_user(guid)
+
+    results = await asyncio.gather(*(fetch(guid) for guid in wanted), return_exceptions=True)
+    for result in results:
+        # Unknown users raise a 404, their profile stays None; any other failure means Keycloak cannot be reached
+        if isinstance(result, BaseException) and not _is_not_found(result):
+            raise result
+    users = [user for user in results if user and not isinstance(user, BaseException)]
+    return _profiles_from_users(wanted, users)
+
+
+def get_realm_profiles() -> Dict[str, Dict[str, str]]:
+    """
+    Retrieve the profiles (username and display name) of all the users of the realm, listed page by page
+    by the admin client. Meant for batch jobs comparing the whole realm with the local users, see sync_user_profiles.
+
+    :return: A mapping from each GUID of the realm to its profile.
+    :rtype: Dict[str, Dict[str, str]]
+    :raises Exception: If Keycloak cannot be reached.
+    """
+    users = _get_keycloak_admin().get_users({'briefRepresentation': True})
+    return _profiles_from_users((), users)
+
+
+def get_user_display_names(guids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """
+    Resolve the display names of several Keycloak users at once.
+    Cached names are served from the per-process cache, and the unknown ones are resolved in batch with get_user_profiles.
+
+    :param guids: The Keycloak user IDs (duplicates are ignored).
+    :type guids: Iterable[str]
+    :return: A mapping from each GUID to its display name, or None if the user was not found.
+    :rtype: Dict[str, Optional[str]]
+    """
+    names: Dict[str, Optional[str]] = {}
+    missing = []
+    for guid in {str(guid) for guid in guids}:
+        cached = _display_name_cache.get(guid)
+        if cached is TTLCache.MISSING:
+            missing.append(guid)
+        else:
+            names[guid] = cached
+    if not missing:
+        return names
+
     try:
-        user = keycloak_admin.get_user(guid)
-        first = user.get('firstName', '')
-        last = user.get('lastName', '')
-        if first or last:
-            return f"{first} {last}".strip()
-        return user.get('preferred_username') or user.get('email') or user.get('id')
-    except Exception:
-        return None
+        profiles = get_user_profiles(missing)
+    except Exception as e:
+        # Keycloak is unreachable: do not cache anything, the next request will try again
+        logger.warning(f"Failed to resolve {len(missing)} display name(s): {type(e).__name__}: {e}")
+        names.update(dict.fromkeys(missing))
+        return names
+
+    for guid, profile in profiles.items():
+        names[guid] = profile['display_name'] if profile else None
+        _display_name_cache.set(guid, names[guid])
+    return names
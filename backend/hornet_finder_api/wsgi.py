@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hornet_finder_api.settings')
 
 application = get_wsgi_application()
+
+# Load the realm signing keys when the worker starts, instead of during the first authenticated request
+from hornet_finder_api.authentication import JWTBearerAuthentication  # noqa: E402
+
+JWTBearerAuthentication.jwks.warm_up()